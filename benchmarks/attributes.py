@@ -0,0 +1,140 @@
+"""Latency and throughput of device attribute reads and writes
+
+Runs every `TachoMotor` and `Infrared_Sensor` property against a fake
+sysfs tree, both unmanaged (a file is opened on each access) and managed
+(within a `with` block, over pooled handles), and reads `Position` of
+several motors in a row to measure fan-out. Results are written as JSON.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/attributes.py [--backend directory|memory]
+        [--iterations N] [--motors N] [--output FILE]
+"""
+
+import fakedevices
+import harness
+
+# Readable properties per device class
+#
+MOTORREADS = [
+    'Address', 'Commands', 'Count_Per_Rot', 'Driver_Name', 'Duty_Cycle', 'Duty_Cycle_SP',
+    'Encoder_Polarity', 'Polarity', 'Position', 'Position_SP', 'Speed', 'Speed_SP',
+    'Speed_Regulation_Enabled', 'State', 'stop_command',
+]
+
+SENSORREADS = [
+    'Address', 'Driver_Name', 'Mode', 'Modes', 'Num_Values', 'Proximity',
+]
+
+# Writable properties per device class and the value to write. A tuple
+# holds values written in turn, for properties that skip writing the
+# value they hold already.
+#
+MOTORWRITES = [
+    ('Command', 'run-direct'), ('Duty_Cycle_SP', (50, -50)), ('Position', 0), ('Position_SP', 90),
+    ('Speed_SP', 100), ('Speed_Regulation_Enabled', 'off'), ('stop_command', 'coast'),
+]
+
+SENSORWRITES = [
+    ('Mode', ('IR-PROX', 'IR-SEEK')),
+]
+
+
+def _reader(device, name):
+    return lambda: getattr(device, name)
+
+def _writer(device, name, value):
+    if not isinstance(value, tuple):
+        return lambda: setattr(device, name, value)
+
+    import itertools
+    values = itertools.cycle(value)
+    return lambda: setattr(device, name, next(values))
+
+
+def _deviceoperations(device, reads, writes):
+    """Yield (name, operation) for each property of `device`
+    """
+    for name in reads:
+        yield 'read ' + name, _reader(device, name)
+    for name, value in writes:
+        yield 'write ' + name, _writer(device, name, value)
+
+
+def _sensoroperations(sensor):
+    for name, operation in _deviceoperations(sensor, SENSORREADS, SENSORWRITES):
+        yield name, operation
+    yield 'call SeekHeading', lambda: sensor.SeekHeading(1)
+    yield 'call SeekDistance', lambda: sensor.SeekDistance(1)
+
+
+def _fanout(motors):
+    def operation():
+        for motor in motors:
+            motor.Position
+    return operation
+
+
+def run(backendkind='directory', iterations=2000, nmotors=4):
+    """Run the benchmark
+
+    Args:
+        backendkind (str): Either 'directory' or 'memory'
+        iterations (int): Number of calls per measurement
+        nmotors (int): Number of motors for the fan-out measurement
+
+    Returns:
+        dict: Report with one result per property and mode
+    """
+    from ev3control import ev3
+
+    backend, cleanup = fakedevices.makebackend(backendkind, motors=nmotors, sensors=1)
+    results = []
+
+    def record(device, mode, operation, fn):
+        result = harness.measure(fn, iterations)
+        result.update({'device': device, 'mode': mode, 'operation': operation})
+        results.append(result)
+
+    try:
+        motor  = ev3.TachoMotor('A', backend=backend)
+        sensor = ev3.Infrared_Sensor(1, backend=backend)
+        motors = [ ev3.TachoMotor(port, backend=backend) for port in 'ABCD'[:nmotors] ]
+
+        for mode in ('unmanaged', 'managed'):
+            if mode == 'managed':
+                motor.__enter__()
+                sensor.__enter__()
+                for m in motors:
+                    m.__enter__()
+            try:
+                for name, fn in _deviceoperations(motor, MOTORREADS, MOTORWRITES):
+                    record('TachoMotor', mode, name, fn)
+                for name, fn in _sensoroperations(sensor):
+                    record('Infrared_Sensor', mode, name, fn)
+                record('TachoMotor', mode, 'fan-out Position x%(n)d'%{'n': nmotors}, _fanout(motors))
+            finally:
+                if mode == 'managed':
+                    motor.__exit__(None, None, None)
+                    sensor.__exit__(None, None, None)
+                    for m in motors:
+                        m.__exit__(None, None, None)
+    finally:
+        cleanup()
+
+    return harness.report('attributes', results, backend=backendkind, iterations=iterations, motors=nmotors)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', choices=['directory', 'memory'], default='directory')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--motors', type=int, default=4, choices=[1, 2, 3, 4])
+    parser.add_argument('--output', default=None, help="File to write JSON to, stdout by default")
+    args = parser.parse_args()
+
+    harness.emit(run(args.backend, args.iterations, args.motors), args.output)
+
+if __name__=='__main__':
+    main()
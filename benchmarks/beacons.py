@@ -0,0 +1,86 @@
+"""Cost of reading the IR beacons on all channels
+
+Compares reading heading and distance of the four channels one value file
+at a time with `SeekHeading()` and `SeekDistance()`, converting and
+filtering them in Python, with a single `read_beacons()` call, with and
+without a `beacons.BeaconFilter`. Runs on an infrared sensor of a fake
+sysfs tree in IR-SEEK mode. Requires NumPy.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/beacons.py [--iterations N] [--output FILE]
+"""
+
+import struct
+
+import fakedevices
+import harness
+
+_values = (5, 40, 0, -128, -10, 60, 0, -128)
+
+
+def _perchannel(sensor):
+    """Read and convert the channels one at a time
+    """
+    def operation():
+        result = []
+        for channel in range(1, 5):
+            distance = int(sensor.SeekDistance(channel))
+            if distance == -128:
+                result.append(None)
+            else:
+                result.append((float(sensor.SeekHeading(channel)), float(distance)))
+        return result
+    return operation
+
+
+def run(iterations=5000):
+    """Run the benchmark
+
+    Args:
+        iterations (int): Number of reads per measurement
+
+    Returns:
+        dict: Report with one result per read path
+    """
+    from ev3control import beacons
+    from ev3control.ev3 import Infrared_Sensor
+
+    backend, cleanup = fakedevices.makebackend('directory', motors=0, sensors=1)
+    try:
+        folder = backend.registry('lego-sensor').find('in1')
+        backend.write(folder, 'mode', 'IR-SEEK')
+        backend.write(folder, 'num_values', '8')
+        backend.write(folder, 'bin_data', struct.pack('<8b', *_values) + b'\x00' * 24)
+        for i, value in enumerate(_values):
+            backend.write(folder, 'value%(n)d'%{'n': i}, str(value))
+
+        with Infrared_Sensor(1, backend=backend) as sensor:
+            beaconfilter = beacons.BeaconFilter()
+            paths = [
+                ('per channel',          _perchannel(sensor)),
+                ('read_beacons',         lambda: beacons.read_beacons(sensor)),
+                ('read_beacons+filter',  lambda: beacons.read_beacons(sensor, beaconfilter)),
+            ]
+            results = []
+            for name, operation in paths:
+                result = harness.measure(operation, iterations)
+                result['path'] = name
+                results.append(result)
+    finally:
+        cleanup()
+
+    return harness.report('beacons', results, iterations=iterations)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--output', default=None, help="File to write JSON to, stdout by default")
+    args = parser.parse_args()
+
+    harness.emit(run(args.iterations), args.output)
+
+if __name__=='__main__':
+    main()
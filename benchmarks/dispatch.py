@@ -0,0 +1,96 @@
+"""Throughput of event dispatch through the controllers
+
+Replays a synthetic event log as fast as possible through an
+`eventlog.EventReplay` with the controllers of the RC car sample attached:
+a `DutyCycleController` on the left stick driving a motor, an
+`XBoxStateController` on the right stick and a `RelPosController` on two
+buttons. The motors live in a `sysfs.MemoryBackend` or on a tmpfs.
+
+Reported is the number of events dispatched per second, once without
+any callbacks, to measure the replay itself, and once with the
+controllers attached. Pass `--log` to replay a recorded log instead.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/dispatch.py [--events N] [--backend KIND] [--log FILE] [--output FILE]
+"""
+
+import os
+
+import fakedevices
+import harness
+from fakedevices import ABS_X, ABS_RX, BTN_B, BTN_X
+
+
+def _throughput(replay, repeat):
+    """Events per second of the best of `repeat` replays
+    """
+    best = None
+    for i in range(repeat):
+        start = harness.timer()
+        count = replay.run()
+        elapsed = harness.timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best if best > 0 else float('inf')
+
+
+def run(events=100000, kind='memory', log=None, repeat=3):
+    """Run the benchmark
+
+    Args:
+        events (int): Number of events in the synthetic log
+        kind (str): Backend of the motors, either 'memory' or 'directory'
+        log (str or None): Recorded log to replay instead of a synthetic one
+        repeat (int): Number of replays per measurement, the best counts
+
+    Returns:
+        dict: Report with the throughput without and with controllers
+    """
+    import tempfile
+    from ev3control import controllers, eventlog
+    from ev3control.ev3 import TachoMotor
+
+    path = log
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.ev3log')
+        os.close(handle)
+        fakedevices.writeeventlog(path, events)
+
+    backend, cleanup = fakedevices.makebackend(kind, motors=2, sensors=0)
+    try:
+        results = []
+
+        replay = eventlog.EventReplay(path, speed=None)
+        results.append({'callbacks': 'none', 'events': len(replay),
+                        'events_per_sec': _throughput(replay, repeat)})
+
+        replay = eventlog.EventReplay(path, speed=None)
+        with TachoMotor('A', backend=backend) as drive, TachoMotor('B', backend=backend) as steer:
+            controllers.DutyCycleController(replay, motor=drive, event=ABS_X, deadzone=0.1, expo=0.3)
+            controllers.XBoxStateController(replay, event=ABS_RX)
+            controllers.RelPosController(replay, steer, left=BTN_X, right=BTN_B)
+            results.append({'callbacks': 'controllers', 'events': len(replay),
+                            'events_per_sec': _throughput(replay, repeat)})
+    finally:
+        cleanup()
+        if log is None:
+            os.remove(path)
+
+    return harness.report('dispatch', results, events=events, backend=kind,
+                          log=log, repeat=repeat)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--backend', default='memory', choices=('memory', 'directory'))
+    parser.add_argument('--log', default=None, help="Recorded log to replay")
+    parser.add_argument('--output', default=None, help="File to write JSON to, stdout by default")
+    args = parser.parse_args()
+
+    harness.emit(run(args.events, args.backend, args.log), args.output)
+
+if __name__=='__main__':
+    main()
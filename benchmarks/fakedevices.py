@@ -0,0 +1,153 @@
+"""Fake EV3 devices for benchmarks
+
+Builds a `sysfs.DirectoryBackend` or `sysfs.MemoryBackend` populated with
+tacho motors and infrared sensors whose attributes look like the ones the
+ev3dev drivers provide, and synthetic event logs of a gamepad.
+"""
+
+import os
+import random
+
+# Codes from linux/input.h of the axes and buttons in synthetic event logs
+#
+ABS_X, ABS_Y, ABS_RX, ABS_RY = 0, 1, 3, 4
+BTN_B, BTN_X = 305, 307
+SYN_REPORT = 0
+
+
+def motorattributes(port):
+    """Attributes of a large tacho motor
+
+    Args:
+        port (str): Port of the motor, e.g. 'outA'
+
+    Returns:
+        dict: Mapping of attribute name to value
+    """
+    return {
+        'address':          port,
+        'command':          '',
+        'commands':         'run-forever run-to-abs-pos run-to-rel-pos run-timed run-direct stop reset',
+        'count_per_rot':    '360',
+        'driver_name':      'lego-ev3-l-motor',
+        'duty_cycle':       '0',
+        'duty_cycle_sp':    '0',
+        'encoder_polarity': 'normal',
+        'polarity':         'normal',
+        'position':         '0',
+        'position_sp':      '0',
+        'speed':            '0',
+        'speed_sp':         '0',
+        'speed_regulation': 'off',
+        'state':            '',
+        'stop_command':     'coast',
+        'stop_commands':    'coast brake hold',
+    }
+
+
+def sensorattributes(port):
+    """Attributes of an infrared sensor in IR-PROX mode
+
+    Args:
+        port (str): Port of the sensor, e.g. 'in1'
+
+    Returns:
+        dict: Mapping of attribute name to value
+    """
+    attributes = {
+        'address':         port,
+        'bin_data':        '\x00' * 32,
+        'bin_data_format': 's8',
+        'driver_name':     'lego-ev3-ir',
+        'mode':            'IR-PROX',
+        'modes':           'IR-PROX IR-SEEK IR-REMOTE IR-REM-A IR-S-ALT IR-CAL',
+        'num_values':      '1',
+    }
+    for i in range(8):
+        attributes['value%(n)d'%{'n': i}] = '0'
+    return attributes
+
+
+def tmpfsroot():
+    """Create an empty folder, on a tmpfs if one is available
+
+    Returns:
+        str: Path of the folder
+    """
+    import tempfile
+    shm = '/dev/shm'
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return tempfile.mkdtemp(prefix='ev3control-', dir=shm)
+    return tempfile.mkdtemp(prefix='ev3control-')
+
+
+def makebackend(kind, motors=4, sensors=1):
+    """Create a backend with fake devices
+
+    Motors are connected to outA, outB, ... and sensors to in1, in2, ...
+
+    Args:
+        kind (str): Either 'directory' or 'memory'
+        motors (int): Number of tacho motors
+        sensors (int): Number of infrared sensors
+
+    Returns:
+        tpl of (sysfs.Backend, callable): The backend and a function that
+            removes any files it created
+    """
+    from ev3control import sysfs
+
+    if kind == 'directory':
+        root = tmpfsroot()
+        backend = sysfs.DirectoryBackend(root)
+
+        def cleanup():
+            import shutil
+            shutil.rmtree(root)
+    elif kind == 'memory':
+        backend = sysfs.MemoryBackend()
+
+        def cleanup():
+            pass
+    else:
+        raise ValueError("Unknown backend '%(k)s'"%{'k': kind})
+
+    for i in range(motors):
+        port = 'out' + 'ABCD'[i]
+        backend.adddevice('tacho-motor', 'motor%(n)d'%{'n': i}, motorattributes(port))
+    for i in range(sensors):
+        port = 'in%(n)d'%{'n': i + 1}
+        backend.adddevice('lego-sensor', 'sensor%(n)d'%{'n': i}, sensorattributes(port))
+
+    return backend, cleanup
+
+
+def writeeventlog(path, events, seed=0):
+    """Write a synthetic event log of stick movements and button presses
+
+    Args:
+        path (str): File to write the log to, see `eventlog`
+        events (int): Approximate number of events
+        seed (int): Seed of the random generator
+    """
+    from ev3control import eventlog
+    from ev3control.xbox import EV_SYN, EV_KEY, EV_ABS
+
+    rnd  = random.Random(seed)
+    axes = (ABS_X, ABS_Y, ABS_RX, ABS_RY)
+    absinfos = dict((code, eventlog.AbsInfo(0, -32768, 32767, 16, 128, 0)) for code in axes)
+    with eventlog.EventRecorder(None, path, absinfos) as log:
+        t, n = 0.0, 0
+        while n < events:
+            # A frame of one or two axis updates, sometimes a button,
+            # closed by a SYN_REPORT, at 125 frames per second
+            #
+            t += 0.008
+            for code in rnd.sample(axes, rnd.randint(1, 2)):
+                log.write(t, EV_ABS, code, rnd.randint(-32768, 32767))
+                n += 1
+            if rnd.random() < 0.05:
+                log.write(t, EV_KEY, rnd.choice((BTN_B, BTN_X)), rnd.randint(0, 1))
+                n += 1
+            log.write(t, EV_SYN, SYN_REPORT, 0)
+            n += 1
@@ -0,0 +1,96 @@
+"""Measurement helpers shared by the benchmarks
+"""
+
+import sys
+import time
+
+# Highest resolution clock available
+#
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def percentile(sortedsamples, p):
+    """Value below which `p` percent of the samples fall
+
+    Args:
+        sortedsamples (sequence of float): Samples in ascending order
+        p (float): Percentage between 0 and 100
+
+    Returns:
+        float: Nearest-rank percentile
+    """
+    if not sortedsamples:
+        return float('nan')
+    rank = int(round(p / 100.0 * (len(sortedsamples) - 1)))
+    return sortedsamples[rank]
+
+
+def measure(operation, iterations, warmup=100):
+    """Measure throughput and latency of a function without arguments
+
+    Throughput is measured over a loop without per call timing,
+    latency by timing each call separately.
+
+    Args:
+        operation (callable): Function to measure
+        iterations (int): Number of calls per measurement
+        warmup (int): Number of calls before measuring
+
+    Returns:
+        dict: 'ops_per_sec', 'p50_us' and 'p99_us'
+    """
+    for i in range(warmup):
+        operation()
+
+    start = timer()
+    for i in range(iterations):
+        operation()
+    elapsed = timer() - start
+
+    samples = []
+    append = samples.append
+    for i in range(iterations):
+        t0 = timer()
+        operation()
+        append(timer() - t0)
+    samples.sort()
+
+    return {
+        'ops_per_sec': iterations / elapsed if elapsed > 0 else float('inf'),
+        'p50_us':      percentile(samples, 50) * 1e6,
+        'p99_us':      percentile(samples, 99) * 1e6,
+    }
+
+
+def report(name, results, **parameters):
+    """Wrap results together with information on the environment
+
+    Args:
+        name (str): Name of the benchmark
+        results (list of dict): One dict per measurement
+        **parameters: Parameters the benchmark was run with
+
+    Returns:
+        dict: Report that can be serialized as JSON
+    """
+    import platform
+    return {
+        'benchmark':  name,
+        'python':     platform.python_version(),
+        'platform':   platform.platform(),
+        'time':       time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'parameters': parameters,
+        'results':    results,
+    }
+
+
+def emit(report, output=None):
+    """Write a report as JSON to `output` or stdout
+    """
+    import json
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
@@ -0,0 +1,110 @@
+"""Cost of reading an integer attribute, string path versus buffer path
+
+Compares `int(backend.pread(fd))`, which creates a string per read, with
+the function returned by `backend.intreader(fd)`, which reads into a
+preallocated buffer and parses it from a buffer object on that memory.
+Both run on an opened 'position' attribute of a fake sysfs tree.
+
+Besides time per read, the number of allocations per read is reported
+when the interpreter can count them: object allocations on COUNT_ALLOCS
+builds (`sys.getcounts()`), and otherwise the peak number of bytes held
+by transient allocations per read (`tracemalloc`, Python 3.9 and up).
+On interpreters that offer neither, e.g. a regular build of Python 2,
+these fields are null.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/intreads.py [--iterations N] [--output FILE]
+"""
+
+import sys
+
+import fakedevices
+import harness
+
+
+def _countallocations(operation, iterations):
+    """Objects allocated per call of `operation`, None if unknown
+    """
+    getcounts = getattr(sys, 'getcounts', None)
+    if getcounts is None:
+        return None
+
+    def total():
+        return sum(allocs for name, allocs, frees, maxalloc in getcounts())
+
+    before = total()
+    for i in range(iterations):
+        operation()
+    return float(total() - before) / iterations
+
+
+def _peakbytes(operation, iterations):
+    """Peak bytes held by transient allocations per call, None if unknown
+    """
+    try:
+        import tracemalloc
+        tracemalloc.reset_peak
+    except (ImportError, AttributeError):
+        return None
+
+    tracemalloc.start()
+    try:
+        peaks = 0
+        for i in range(iterations):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            operation()
+            peaks += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return float(peaks) / iterations
+
+
+def run(iterations=20000, value='-123456'):
+    """Run the benchmark
+
+    Args:
+        iterations (int): Number of reads per measurement
+        value (str): Value of the attribute
+
+    Returns:
+        dict: Report with one result per read path
+    """
+    backend, cleanup = fakedevices.makebackend('directory', motors=1, sensors=0)
+    try:
+        folder = backend.registry('tacho-motor').find('outA')
+        backend.write(folder, 'position', value)
+        fd = backend.open(folder, 'position')
+        try:
+            paths = [
+                ('int(pread)', lambda: int(backend.pread(fd))),
+                ('intreader',  backend.intreader(fd)),
+            ]
+            results = []
+            for name, operation in paths:
+                assert operation() == int(value)
+                result = harness.measure(operation, iterations)
+                result['path'] = name
+                result['allocations_per_read'] = _countallocations(operation, iterations)
+                result['peak_bytes_per_read']  = _peakbytes(operation, min(iterations, 2000))
+                results.append(result)
+        finally:
+            backend.close(fd)
+    finally:
+        cleanup()
+
+    return harness.report('intreads', results, iterations=iterations, value=value)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', default=None, help="File to write JSON to, stdout by default")
+    args = parser.parse_args()
+
+    harness.emit(run(args.iterations), args.output)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Cost of reading input events, evdev versus bulk decoding
+
+Feeds `struct input_event` records through a pipe and reads them back in
+batches, once the way `evdev.InputDevice.read()` does, creating an
+`InputEvent` per event, and once with each read method of a
+`rawinput.RawEventReader`. The events come from an `eventlog` log, a
+synthetic one by default. Writing a batch into the pipe is part of each
+measurement; the 'os.read' result measures that plus reading the bytes
+without decoding them.
+
+The evdev path needs python-evdev, the 'readarray' path NumPy. Paths
+whose dependency is missing are left out.
+
+Usage, from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/rawinput.py [--batch N] [--iterations N] [--log FILE] [--output FILE]
+"""
+
+import os
+
+import fakedevices
+import harness
+
+
+def _batches(events, batch):
+    """Split events into raw `struct input_event` batches
+
+    Returns:
+        list of bytes: One string of `batch` records per batch
+    """
+    from ev3control.rawinput import INPUT_EVENT
+    records = [ INPUT_EVENT.pack(e.sec, e.usec, e.type, e.code, e.value) for e in events ]
+    return [ b''.join(records[i:i + batch]) for i in range(0, len(records) - batch + 1, batch) ]
+
+
+def _evdevreader(fd):
+    """The read path of `evdev.InputDevice`, on an arbitrary descriptor
+    """
+    try:
+        from evdev.eventio import EventIO
+    except ImportError:
+        return None
+
+    class _PipeIO(EventIO):
+        def __init__(self, fd):
+            self.fd = fd
+
+    return _PipeIO(fd).read
+
+
+def run(batch=32, iterations=5000, log=None):
+    """Run the benchmark
+
+    Args:
+        batch (int): Number of events written and read at once
+        iterations (int): Number of batches per measurement
+        log (str or None): Recorded log to take the events from
+
+    Returns:
+        dict: Report with one result per read path
+    """
+    import tempfile
+    from ev3control import eventlog, rawinput
+
+    path = log
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.ev3log')
+        os.close(handle)
+        fakedevices.writeeventlog(path, max(batch * 64, 4096))
+    try:
+        absinfos, events = eventlog.readlog(path)
+    finally:
+        if log is None:
+            os.remove(path)
+    batches = _batches(events, batch)
+
+    rfd, wfd = os.pipe()
+    try:
+        reader = rawinput.RawEventReader(rfd, maxevents=batch)
+        size = len(batches[0])
+        def rawread():
+            os.read(rfd, size)
+            return ()
+        paths = [
+            ('os.read',     rawread),
+            ('evdev',       _evdevreader(rfd)),
+            ('read',        reader.read),
+            ('readtuples',  reader.readtuples),
+        ]
+        try:
+            import numpy
+            paths.append(('readarray', reader.readarray))
+        except ImportError:
+            pass
+
+        results = []
+        for name, read in paths:
+            if read is None:
+                continue
+            state = {'i': 0}
+            def operation():
+                i = state['i']
+                state['i'] = (i + 1) % len(batches)
+                os.write(wfd, batches[i])
+                for event in read():
+                    pass
+            result = harness.measure(operation, iterations)
+            result['path'] = name
+            result['events_per_sec'] = result['ops_per_sec'] * batch
+            results.append(result)
+    finally:
+        os.close(rfd)
+        os.close(wfd)
+
+    return harness.report('rawinput', results, batch=batch, iterations=iterations, log=log)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--log', default=None, help="Recorded log to take the events from")
+    parser.add_argument('--output', default=None, help="File to write JSON to, stdout by default")
+    args = parser.parse_args()
+
+    harness.emit(run(args.batch, args.iterations, args.log), args.output)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,379 @@
+"""asyncio interface to EV3 devices
+
+`AsyncTachoMotor` and `AsyncSensor` wrap the devices of `ev3` and return
+futures for attribute reads and writes, so that many devices and
+controllers can share a single thread running an event loop.
+
+Reads and writes are performed when the event loop reports the descriptor
+of the attribute ready, through `add_reader()` and `add_writer()`. Requests
+for the same attribute that are queued while waiting are served in the
+same loop iteration. Descriptors the event loop can not watch, e.g.
+regular files of a `sysfs.DirectoryBackend`, fall back to an executor.
+Attributes of a backend without descriptors, e.g. `sysfs.MemoryBackend`,
+are accessed right away.
+
+This module uses `asyncio` if available and the `trollius` backport
+otherwise. It does not use coroutine syntax itself; the returned futures
+can be waited for with `yield From(...)` (trollius), `yield from` or `await`.
+"""
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from array import array
+
+from .ev3 import AttributePool
+
+
+def _newfuture(loop):
+    create = getattr(loop, 'create_future', None)
+    if create is not None:
+        return create()
+    return asyncio.Future(loop=loop)
+
+
+def _settle(future, operation):
+    """Complete `future` with the result or the exception of `operation()`
+    """
+    if future.cancelled():
+        return
+    try:
+        result = operation()
+    except Exception as e:
+        future.set_exception(e)
+    else:
+        future.set_result(result)
+
+
+class AsyncDevice(object):
+    """Awaitable access to the attributes of a device
+
+    The attributes are kept open in a pool of their own, so the wrapped
+    device can still be used directly. Use in a `with` block, or call
+    `close()` when done.
+
+    Args:
+        device (ev3.Device): Device to wrap
+        loop (asyncio.AbstractEventLoop or None): Event loop, None for the current one
+        executor (concurrent.futures.Executor or None): Executor for attributes
+            the event loop can not watch, None for the default executor of the loop
+    """
+    def __init__(self, device, loop=None, executor=None):
+        self._device   = device
+        self._backend  = device.backend
+        self._loop     = loop or asyncio.get_event_loop()
+        self._executor = executor
+        self._pool     = AttributePool(self._backend, device.folder)
+
+        # Per descriptor, the operations waiting for it to become
+        # readable or writable
+        #
+        self._readers  = {}
+        self._writers  = {}
+
+        # Descriptors the event loop can not watch
+        #
+        self._unwatchable = set()
+
+    def _get_device(self):
+        return self._device
+
+    device = property(_get_device)
+    """The wrapped device
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def close(self):
+        """Cancel pending operations and close the attributes
+        """
+        for pending, remove in ((self._readers, self._loop.remove_reader),
+                                (self._writers, self._loop.remove_writer)):
+            for fd, operations in pending.items():
+                remove(fd)
+                for future, operation in operations:
+                    future.cancel()
+            pending.clear()
+        self._unwatchable.clear()
+        self._pool.close()
+
+    def _submit(self, attribute, operation, write=False):
+        """Perform `operation` once the descriptor of `attribute` is ready
+
+        Args:
+            attribute (str): Attribute `operation` accesses
+            operation (callable): Function without arguments that performs the access
+            write (bool): Whether `operation` writes
+
+        Returns:
+            asyncio.Future: Result of `operation`
+        """
+        fd = self._backend.fileno(self._pool.handle(attribute))
+        if fd is None:
+            future = _newfuture(self._loop)
+            _settle(future, operation)
+            return future
+
+        if fd in self._unwatchable:
+            return self._loop.run_in_executor(self._executor, operation)
+
+        pending = self._writers if write else self._readers
+        future = _newfuture(self._loop)
+        operations = pending.get(fd)
+        if operations is None:
+            if write:
+                add, remove = self._loop.add_writer, self._loop.remove_writer
+            else:
+                add, remove = self._loop.add_reader, self._loop.remove_reader
+            try:
+                add(fd, self._ready, fd, write)
+            except (OSError, IOError, ValueError):
+                # Some selectors keep track of a descriptor they failed to
+                # register, which would break a later descriptor with the
+                # same number
+                #
+                try:
+                    remove(fd)
+                except (OSError, IOError, ValueError, KeyError):
+                    pass
+                self._unwatchable.add(fd)
+                return self._loop.run_in_executor(self._executor, operation)
+            operations = pending[fd] = []
+        operations.append((future, operation))
+        return future
+
+    def _ready(self, fd, write):
+        """Perform all operations waiting for `fd`
+        """
+        if write:
+            self._loop.remove_writer(fd)
+            operations = self._writers.pop(fd, ())
+        else:
+            self._loop.remove_reader(fd)
+            operations = self._readers.pop(fd, ())
+        for future, operation in operations:
+            _settle(future, operation)
+
+    def read(self, attribute):
+        """Read an attribute
+
+        Returns:
+            asyncio.Future: Value of the attribute as a str
+        """
+        pool = self._pool
+        return self._submit(attribute, lambda: pool.read(attribute))
+
+    def readint(self, attribute):
+        """Read an integer attribute
+
+        Returns:
+            asyncio.Future: Value of the attribute as an int
+        """
+        pool = self._pool
+        return self._submit(attribute, lambda: pool.readint(attribute))
+
+    def write(self, attribute, value):
+        """Write an attribute
+
+        Args:
+            attribute (str): Name of the attribute
+            value (str): Value to write
+
+        Returns:
+            asyncio.Future: Completes with None once written
+        """
+        pool = self._pool
+        return self._submit(attribute, lambda: pool.write(attribute, value), write=True)
+
+
+class AsyncTachoMotor(AsyncDevice):
+    """Awaitable counterpart of `ev3.TachoMotor`
+
+    Args:
+        motor (ev3.TachoMotor or str): Motor to wrap, or the port of the motor
+        loop (asyncio.AbstractEventLoop or None): Event loop, None for the current one
+        executor (concurrent.futures.Executor or None): See `AsyncDevice`
+    """
+    def __init__(self, motor, loop=None, executor=None):
+        if isinstance(motor, str):
+            from .ev3 import TachoMotor
+            motor = TachoMotor(motor)
+        super(AsyncTachoMotor, self).__init__(motor, loop, executor)
+
+        # Shared with the wrapped motor, so redundant writes are skipped
+        # whichever of the two wrote the last setpoint
+        #
+        self._duty_cycle_sp = motor._duty_cycle_sp
+
+    def position(self):
+        return self.readint('position')
+
+    def speed(self):
+        return self.readint('speed')
+
+    def duty_cycle(self):
+        return self.readint('duty_cycle')
+
+    def state(self):
+        """Run state of the motor
+
+        Returns:
+            asyncio.Future: list of str
+        """
+        future = _newfuture(self._loop)
+        def done(read):
+            if read.cancelled():
+                future.cancel()
+            elif read.exception() is not None:
+                future.set_exception(read.exception())
+            else:
+                value = read.result()
+                future.set_result(value.split(' ') if value else [])
+        self.read('state').add_done_callback(done)
+        return future
+
+    def set_duty_cycle_sp(self, duty_cycle):
+        """Set the duty cycle setpoint, unless it equals the last one written
+
+        The last setpoint written is shared with the wrapped motor, see
+        `ev3.SetpointWriter`.
+
+        Returns:
+            asyncio.Future: Completes with None once written
+        """
+        value = str(int(duty_cycle))
+        setpoints = self._duty_cycle_sp
+        if not setpoints.prepare(value):
+            future = _newfuture(self._loop)
+            future.set_result(None)
+            return future
+
+        def done(write):
+            if not write.cancelled() and write.exception() is None:
+                setpoints.record(value)
+            else:
+                setpoints.invalidate()
+        write = self.write('duty_cycle_sp', value)
+        write.add_done_callback(done)
+        return write
+
+    def command(self, command):
+        """Send a command to the motor
+
+        Returns:
+            asyncio.Future: Completes with None once written
+        """
+        write = self.write('command', command)
+        if command == 'reset':
+            write.add_done_callback(lambda write: self._duty_cycle_sp.invalidate())
+        return write
+
+    def run_direct(self):
+        return self.command('run-direct')
+
+    def run_forever(self):
+        return self.command('run-forever')
+
+    def stop(self):
+        return self.command('stop')
+
+    def reset(self):
+        return self.command('reset')
+
+
+class AsyncSensor(AsyncDevice):
+    """Awaitable counterpart of `ev3.LegoSensor`
+
+    The number of values of the current mode is read on construction
+    and after each `set_mode()`.
+
+    Args:
+        sensor (ev3.LegoSensor or int): Sensor to wrap, or the port of the sensor
+        loop (asyncio.AbstractEventLoop or None): Event loop, None for the current one
+        executor (concurrent.futures.Executor or None): See `AsyncDevice`
+    """
+    def __init__(self, sensor, loop=None, executor=None):
+        if isinstance(sensor, (int, str)):
+            from .ev3 import LegoSensor
+            sensor = LegoSensor(sensor)
+        super(AsyncSensor, self).__init__(sensor, loop, executor)
+        self._numvalues = self._pool.readint('num_values')
+
+    def value(self, i):
+        """Read value `i` of the current mode
+
+        Returns:
+            asyncio.Future: The value as an int
+        """
+        return self.readint('value%(n)d'%{'n': i})
+
+    def read_all(self):
+        """Read every value of the current mode
+
+        Returns:
+            asyncio.Future: array of int with one value per value file
+        """
+        reads  = [ self.value(i) for i in range(self._numvalues) ]
+        future = _newfuture(self._loop)
+        if not reads:
+            future.set_result(array('i'))
+            return future
+
+        remaining = [len(reads)]
+        def done(read):
+            remaining[0] -= 1
+            if remaining[0] or future.done():
+                return
+            for r in reads:
+                if r.cancelled():
+                    future.cancel()
+                    return
+                if r.exception() is not None:
+                    future.set_exception(r.exception())
+                    return
+            future.set_result(array('i', [ r.result() for r in reads ]))
+        for read in reads:
+            read.add_done_callback(done)
+        return future
+
+    def mode(self):
+        """Read the current mode
+
+        Returns:
+            asyncio.Future: The mode as a str
+        """
+        return self.read('mode')
+
+    def set_mode(self, mode):
+        """Change the mode of the sensor
+
+        Returns:
+            asyncio.Future: Completes with None once the mode is set and
+                its number of values is known
+        """
+        future = _newfuture(self._loop)
+        def written(write):
+            if write.cancelled():
+                future.cancel()
+                return
+            if write.exception() is not None:
+                future.set_exception(write.exception())
+                return
+            def counted(count):
+                if count.cancelled():
+                    future.cancel()
+                    return
+                if count.exception() is not None:
+                    future.set_exception(count.exception())
+                    return
+                self._numvalues = count.result()
+                future.set_result(None)
+            self.readint('num_values').add_done_callback(counted)
+        self.write('mode', mode).add_done_callback(written)
+        return future
@@ -0,0 +1,175 @@
+"""Heading and distance of IR beacons on all channels at once
+
+In IR-SEEK mode the infrared sensor reports a heading and a distance for
+each of the four beacon channels. `read_beacons()` reads all of them in
+one go, from 'bin_data' when the sensor is in a `with` block, and returns
+them as a NumPy masked array with one row per channel. Channels without a
+beacon in sight are masked.
+
+A `BeaconFilter` smooths the readings and rejects outliers for all
+channels at once, so tracking several beacons takes no per channel work
+in Python.
+
+Requires NumPy.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Mode the sensor should be in, the number of channels and the distance
+# the sensor reports for a channel without a beacon in sight
+#
+SEEK_MODE  = 'IR-SEEK'
+CHANNELS   = 4
+NO_BEACON  = -128
+
+# Columns of the rows returned by `read_beacons()`
+#
+HEADING    = 0
+DISTANCE   = 1
+
+
+def _requirenumpy():
+    if np is None:
+        raise ImportError("Beacon decoding requires NumPy")
+
+
+def decode(values):
+    """Decode the values of IR-SEEK mode
+
+    Args:
+        values (buffer or sequence of int): The 8 values of IR-SEEK mode, either
+            the raw signed bytes of 'bin_data' or integers
+
+    Returns:
+        numpy.ma.MaskedArray: Array of float of shape (4, 2), with row `i` the
+            heading and distance of channel `i+1`. Rows of channels
+            without a beacon in sight are masked.
+    """
+    _requirenumpy()
+    if isinstance(values, memoryview):
+        raw = np.asarray(values).view(np.int8)[:2*CHANNELS]
+    elif isinstance(values, (bytes, bytearray)):
+        raw = np.frombuffer(values, dtype=np.int8, count=2*CHANNELS)
+    else:
+        raw = np.asarray(values[:2*CHANNELS])
+    raw = raw.reshape(CHANNELS, 2)
+
+    return _masked(raw.astype(float), raw[:, DISTANCE] == NO_BEACON)
+
+
+def _masked(values, absent):
+    """Mask the rows of `values` of the channels in `absent`
+    """
+    mask = np.empty(values.shape, dtype=bool)
+    mask[:] = absent[:, np.newaxis]
+    return np.ma.MaskedArray(values, mask=mask, copy=False)
+
+
+def read_beacons(sensor, filter=None):
+    """Read heading and distance of the beacons on all channels
+
+    Within a `with` block on `sensor` this takes a single read of
+    'bin_data', otherwise one read per value file.
+
+    Args:
+        sensor (ev3.Infrared_Sensor): Sensor in IR-SEEK mode
+        filter (callable or None): Applied to the decoded array before it is
+            returned, e.g. a `BeaconFilter`
+
+    Returns:
+        numpy.ma.MaskedArray: See `decode()`
+
+    Raises:
+        ValueError: When the sensor is not in IR-SEEK mode
+    """
+    _requirenumpy()
+    if sensor.Mode != SEEK_MODE:
+        raise ValueError("Expected sensor in %(m)s mode"%{'m': SEEK_MODE})
+
+    if sensor.Bin_Data_Format == 's8':
+        try:
+            values = sensor.read_bin_data()
+        except RuntimeError:
+            values = sensor.read_all()
+    else:
+        values = sensor.read_all()
+
+    beacons = decode(values)
+    if filter is not None:
+        beacons = filter(beacons)
+    return beacons
+
+
+class BeaconFilter(object):
+    """Smooths beacon readings and rejects outliers, for all channels at once
+
+    A reading of a channel is an outlier when its heading or distance
+    differs more than `maxjump` from the smoothed value. Outliers are
+    ignored, unless a channel has had more than `maxrejects` in a row, in
+    which case the beacon is taken to have moved and the filter restarts
+    from the reading. Other readings are smoothed exponentially. A channel
+    that loses its beacon is masked and restarts from its next reading.
+
+    Args:
+        alpha (float): Weight of a new reading, between 0 and 1. 1 means no smoothing.
+        maxjump (tpl of float or None): Largest plausible change of the heading and
+            the distance between two readings, None to not reject outliers
+        maxrejects (int): Number of outliers in a row after which a reading
+            is accepted
+    """
+    def __init__(self, alpha=0.5, maxjump=(10.0, 30.0), maxrejects=3):
+        _requirenumpy()
+        if not 0 < alpha <= 1:
+            raise ValueError("Expected 0 < alpha <= 1")
+
+        self._alpha      = float(alpha)
+        self._maxjump    = None if maxjump is None else np.asarray(maxjump, dtype=float)
+        self._maxrejects = maxrejects
+
+        self._state      = np.zeros((CHANNELS, 2))
+        self._valid      = np.zeros(CHANNELS, dtype=bool)
+        self._rejects    = np.zeros(CHANNELS, dtype=int)
+
+    def reset(self):
+        """Forget all previous readings
+        """
+        self._valid[:]   = False
+        self._rejects[:] = 0
+
+    def __call__(self, beacons):
+        """Filter a reading
+
+        Args:
+            beacons (numpy.ma.MaskedArray): Reading as returned by `decode()`
+
+        Returns:
+            numpy.ma.MaskedArray: The filtered heading and distance per channel
+        """
+        values = np.ma.getdata(beacons)
+        seen   = ~np.ma.getmaskarray(beacons)[:, DISTANCE]
+
+        # Channels that had a beacon before and see it now are smoothed,
+        # unless the reading is an outlier
+        #
+        tracked = seen & self._valid
+        if self._maxjump is not None:
+            jump    = (np.abs(values - self._state) > self._maxjump).any(axis=1)
+            outlier = tracked & jump
+            self._rejects = np.where(outlier, self._rejects + 1, 0)
+            moved   = self._rejects > self._maxrejects
+            self._rejects[moved] = 0
+            tracked &= ~outlier
+            restart = seen & (~self._valid | moved)
+        else:
+            restart = seen & ~self._valid
+
+        state = self._state
+        state += (self._alpha * tracked)[:, np.newaxis] * (values - state)
+        state  = np.where(restart[:, np.newaxis], values, state)
+        self._state = state
+        self._valid = seen
+
+        return _masked(state.copy(), ~seen)
@@ -0,0 +1,255 @@
+"""Control loops in a child process
+
+A `ProcessController` runs a `controllers.PIDController` in a process of
+its own, so its timing does not suffer from other work that holds the
+GIL of the main process, e.g. serializing JSON in the monitoring server
+or handling a burst of controller events.
+
+The setpoint and the telemetry of the loop are exchanged through blocks
+of shared memory, each guarded by a sequence lock: the single writer
+makes the sequence number odd while it updates the block and even again
+when done, and a reader retries until it sees the same even number
+before and after reading. Neither side ever waits for the other.
+"""
+
+import multiprocessing
+import time
+
+from .clock import monotonic
+
+# Fields of the telemetry block, in order
+#
+TELEMETRY = ('timestamp', 'iterations', 'setpoint', 'pv', 'control', 'overruns')
+
+# Number of retries of a read between checks whether the writer is stuck
+#
+_spins = 1000
+
+
+class SeqlockBlock(object):
+    """Block of floats in shared memory with a single writer
+
+    Reads never block the writer and always return values of a single
+    write. Create before forking, so the child shares the memory.
+
+    Args:
+        size (int): Number of values in the block
+    """
+    def __init__(self, size):
+        self._size  = size
+
+        # Sequence number followed by the values
+        #
+        self._array = multiprocessing.RawArray('d', size + 1)
+
+    def write(self, values):
+        """Replace the values, from the writing process only
+
+        Args:
+            values (sequence of float): `size` values
+        """
+        array    = self._array
+        sequence = array[0]
+        array[0] = sequence + 1
+        array[1:] = values
+        array[0] = sequence + 2
+
+    def read(self, alive=None, timeout=1.0):
+        """A consistent copy of the values
+
+        A writer that dies halfway a write leaves the block locked. While
+        a write is in progress the reader gives up when `alive` tells the
+        writer is gone, or after `timeout` seconds.
+
+        Args:
+            alive (callable or None): Returns whether the writer is still alive
+            timeout (float): Seconds to wait for a write in progress to complete
+
+        Returns:
+            list of float: The values of the latest completed write
+
+        Raises:
+            RuntimeError: When a write in progress did not complete
+        """
+        array = self._array
+        spins = 0
+        while True:
+            sequence = array[0]
+            if sequence % 2:
+                spins += 1
+                if spins % _spins == 0:
+                    if spins == _spins:
+                        deadline = monotonic() + timeout
+                    elif monotonic() > deadline:
+                        raise RuntimeError("Write to shared block did not complete in time")
+                    if alive is not None and not alive():
+                        raise RuntimeError("Writer of shared block ended halfway a write")
+                    time.sleep(0)
+                continue
+            values = array[1:]
+            if array[0] == sequence:
+                return values
+
+    def _get_writes(self):
+        return int(self._array[0]) // 2
+
+    writes = property(_get_writes)
+    """Number of completed writes
+    """
+
+
+class MotorIO(object):
+    """Process variable and output of a loop that drives a motor
+
+    Opens the motor when entered, in the child process, so its attributes
+    are not shared with the parent.
+
+    Args:
+        port (str): Port of the motor
+        field (str): Attribute that is the process variable, either 'position' or 'speed'
+        backend (sysfs.Backend or None): Backend that provides the motor
+    """
+    def __init__(self, port, field='position', backend=None):
+        if field not in ('position', 'speed'):
+            raise ValueError("'%(f)s' can not be a process variable"%{'f': field})
+        self._port    = port
+        self._field   = field.capitalize()
+        self._backend = backend
+        self._motor   = None
+
+    def __enter__(self):
+        from .ev3 import TachoMotor
+        self._motor = TachoMotor(self._port, backend=self._backend)
+        self._motor.__enter__()
+        self._motor.run_direct()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self._motor.stop()
+        self._motor.__exit__(type_, value, traceback)
+        self._motor = None
+
+    def pv(self):
+        return float(getattr(self._motor, self._field))
+
+    def out(self, control):
+        self._motor.Duty_Cycle_SP = control
+
+
+class ProcessController(object):
+    """A PID control loop in a child process
+
+    The loop starts in a new process when entering a `with` block and
+    stops when leaving it. `io` is entered in the child and provides the
+    process variable and takes the output of the loop.
+
+    Args:
+        kp (float): Proportional gain
+        io (object): Context manager with methods `pv()` and `out(control)`, e.g.
+            a `MotorIO`
+        setpoint (float): Initial setpoint
+        ki (float): Integral gain, per second
+        kd (float): Derivative gain, in seconds
+        freq (float): Frequency of the control loop in Hz
+        outlimits (tpl of float or None): Lower and upper bound of the control value
+        overrun (str): Either 'skip' or 'catchup', see `controllers.PIDController`
+    """
+    def __init__(self, kp, io, setpoint=0.0, ki=0.0, kd=0.0, freq=60.0,
+                 outlimits=(-100, 100), overrun='skip'):
+        self._kp        = kp
+        self._ki        = ki
+        self._kd        = kd
+        self._io        = io
+        self._freq      = freq
+        self._outlimits = outlimits
+        self._overrun   = overrun
+
+        self._setpoint  = SeqlockBlock(1)
+        self._telemetry = SeqlockBlock(len(TELEMETRY))
+        self._setpoint.write([setpoint])
+
+        # Child process and the event that stops it
+        #
+        self._process   = None
+        self._stop      = None
+
+    def _get_setpoint(self):
+        return self._setpoint.read()[0]
+
+    def _set_setpoint(self, setpoint):
+        self._setpoint.write([setpoint])
+
+    setpoint = property(_get_setpoint, _set_setpoint)
+    """Setpoint of the loop, takes effect at its next iteration
+    """
+
+    def telemetry(self):
+        """State of the loop after its latest iteration
+
+        Returns:
+            dict: Mapping of the names in `TELEMETRY` to values. 'timestamp' is
+                in seconds of `clock.monotonic()`, 0 before the first iteration.
+
+        Raises:
+            RuntimeError: When the child process ended halfway a write of the telemetry
+        """
+        return dict(zip(TELEMETRY, self._telemetry.read(self._isalive)))
+
+    def _isalive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def _run(self):
+        """Entry point of the child process
+        """
+        import signal
+        from .controllers import PIDController
+
+        # The parent stops the loop, also on an interrupt
+        #
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        setpoint, telemetry = self._setpoint, self._telemetry
+        with self._io as io:
+            last = [0.0, 0.0]
+            def sp():
+                last[0] = setpoint.read()[0]
+                return last[0]
+            def pv():
+                last[1] = io.pv()
+                return last[1]
+            controller = [None]
+            def out(control):
+                io.out(control)
+                c = controller[0]
+                telemetry.write([monotonic(), telemetry.writes + 1, last[0], last[1],
+                                 control, c.overruns])
+
+            controller[0] = PIDController(self._kp, sp, pv, out, ki=self._ki, kd=self._kd,
+                                          freq=self._freq, outlimits=self._outlimits,
+                                          overrun=self._overrun, stats=False)
+            controller[0].run(self._stop)
+
+    def __enter__(self):
+        """Start the control loop in a child process
+
+        Raises:
+            RuntimeError: When the control loop is already running
+        """
+        if self._process:
+            raise RuntimeError("Controller already running")
+
+        self._stop = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=self._run)
+        self._process.daemon = True
+        self._process.start()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """Stop the control loop and wait for the child process to end
+        """
+        self._stop.set()
+        self._process.join(5.0)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+        self._process = None
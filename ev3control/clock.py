@@ -0,0 +1,49 @@
+"""Monotonic clock
+
+`time.monotonic()` only exists as of Python 3.3. On older interpreters
+CLOCK_MONOTONIC is read through librt, and as a last resort the wall
+clock is used.
+"""
+
+import time
+
+
+def _librtmonotonic():
+    """Create a function that reads CLOCK_MONOTONIC via ctypes
+
+    Returns:
+        callable or None: Function returning seconds as a float, or None
+            when clock_gettime() is not available
+    """
+    import ctypes, ctypes.util
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for name in (ctypes.util.find_library('rt'), ctypes.util.find_library('c')):
+        if not name:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        # CLOCK_MONOTONIC
+        #
+        clockid = 1
+
+        def monotonic():
+            ts = timespec()
+            if clock_gettime(clockid, ctypes.byref(ts)) != 0:
+                raise OSError(ctypes.get_errno(), "clock_gettime failed")
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        return monotonic
+
+    return None
+
+
+monotonic = getattr(time, 'monotonic', None) or _librtmonotonic() or time.time
+"""Seconds since an arbitrary, fixed point in time that never goes backwards
+"""
@@ -8,11 +8,25 @@ Evan Goris
 2015
 """
 
+from array import array
+
+from .clock import monotonic
+from .loopstats import LoopStats
+from .xbox import EV_KEY, EV_ABS
+
 class DutyCycleController(object):
     """Use events from an Xbox controller to operate a motor
     
     Events from a given absolute axis are translated to duty cycle
     to operate the speed of a motor.
+
+    The axis value is first normalized to [-1,1], then values within the
+    deadzone are mapped to 0 and the rest is stretched to fill [-1,1]
+    again. The response curve is then applied: either `curve`, or a
+    blend of a linear and a cubic response controlled by `expo`. The
+    mapping is computed at construction for every value the axis can
+    take on, so handling an event takes a single table lookup. Values
+    outside the range of the axis are treated as its nearest end.
     
     Responsibilities:
         Mapping of events to state/speed of a motor
@@ -20,15 +34,20 @@ class DutyCycleController(object):
         at construction a motor port is given instead of a motor object)
         
     TODO:
-        * deadzone
         * break
-        * optional non linear mapping
     
     Args:
         xcevents (XCEvents): object that delivers a sequence of Xbox controller events
         motor (TachoMotor): object representing a motor
         port (str): port on which to search for a motor
         event (str or int): Name or code of an absolute axis
+        deadzone (float): Fraction of each half of the axis around the center
+            that maps to a duty cycle of 0
+        expo (float): Between 0, linear, and 1, cubic. Higher values give finer
+            control around the center.
+        curve (callable or None): Maps a normalized axis value in [-1,1] to a value
+            in [-1,1] and never decreases. Replaces `expo` if given.
+        maxduty (int): Duty cycle at the ends of the axis
         
     Remarks:
         Exactly one of `motor` and `port` should be non-None
@@ -37,7 +56,8 @@ class DutyCycleController(object):
         ValueError: When either both or non of `motor` and `port` are None
     """
 
-    def __init__(self, xcevents, motor=None, port=None, event='ABS_X', verbose=False):
+    def __init__(self, xcevents, motor=None, port=None, event='ABS_X', verbose=False,
+                 deadzone=0.0, expo=0.0, curve=None, maxduty=100):
     
         if motor==None and port==None:
             raise ValueError("At least one of `motor` and `port` should be non-None")
@@ -63,8 +83,12 @@ class DutyCycleController(object):
         self._min = absinfo.min
         self._max = absinfo.max
         self._verbose = verbose
+
+        # Duty cycle for each value of the axis, indexed by value - min
+        #
+        self._table = responsetable(self._min, self._max, deadzone, expo, curve, maxduty)
         
-        xcevents.add_callback(self._callback)
+        xcevents.add_callback(self._callback, (EV_ABS, self._eventcode))
         
         self._motor.reset()
         self._motor.run_direct()
@@ -79,30 +103,96 @@ class DutyCycleController(object):
     def _callback(self, event):
         """Translate an input event to a duty_cycle_sp
         
-        Only events with code given at construction will
-        be handled. The rest is ignored.
+        Only called with events of the axis given at construction.
         
         Args:
             event (InputEvent): Event from a controller
             
         Returns:
-            boolean: True if the event was handled. False otherwise
+            boolean: True
         """
-        import evdev.ecodes
-        if event.type != evdev.ecodes.ecodes['EV_ABS'] or event.code != self._eventcode:
-            return False
-        
-        if event.value > 0:
-            duty_cycle = (100 * event.value) / self._max
-        else:
-            duty_cycle = -(100 * event.value) / self._min
-                
+        # The input core does not keep values within the range of the axis
+        #
+        value = event.value
+        if value < self._min:
+            value = self._min
+        elif value > self._max:
+            value = self._max
+
+        duty_cycle = self._table[value - self._min]
         self._motor.Duty_Cycle_SP = duty_cycle
         if self._verbose:
             print duty_cycle
             
         return True
 
+def responsetable(min_, max_, deadzone=0.0, expo=0.0, curve=None, maxduty=100):
+    """Compute the duty cycle for each value of an absolute axis
+
+    See `DutyCycleController`. The duty cycle is only computed where it
+    changes, which requires a curve that never decreases.
+
+    Args:
+        min_ (int): Minimal value of the axis
+        max_ (int): Maximal value of the axis
+        deadzone (float): Fraction of each half of the axis that maps to 0
+        expo (float): Between 0, linear, and 1, cubic
+        curve (callable or None): Non-decreasing map of [-1,1] to [-1,1], replaces
+            `expo` if given
+        maxduty (int): Duty cycle at the ends of the axis, at most 100
+
+    Returns:
+        array of int: Duty cycle of axis value `v` at index `v - min_`
+
+    Raises:
+        ValueError: When a parameter is out of range
+    """
+    if not 0 <= deadzone < 1:
+        raise ValueError("Expected 0 <= deadzone < 1")
+    if not 0 <= expo <= 1:
+        raise ValueError("Expected 0 <= expo <= 1")
+    if not 0 < maxduty <= 100:
+        raise ValueError("Expected 0 < maxduty <= 100")
+    if curve is None:
+        curve = lambda x: (1 - expo)*x + expo*x**3
+
+    def dutycycle(value):
+        if value > 0:
+            x = float(value) / max_
+        elif value < 0:
+            x = -float(value) / min_
+        else:
+            x = 0.0
+
+        magnitude = abs(x)
+        if magnitude <= deadzone:
+            return 0
+        x = (magnitude - deadzone) / (1 - deadzone) * (1 if x > 0 else -1)
+
+        y = max(-1.0, min(1.0, curve(x)))
+        return int(round(y * maxduty))
+
+    # The duty cycle never decreases with the axis value, so a range of
+    # values whose ends have the same duty cycle has it throughout. Split
+    # ranges until that holds, which takes a few evaluations per step of
+    # the duty cycle rather than one per axis value.
+    #
+    table  = array('b', [0]) * (max_ - min_ + 1)
+    ranges = [(min_, max_, dutycycle(min_), dutycycle(max_))]
+    while ranges:
+        low, high, lowduty, highduty = ranges.pop()
+        if lowduty == highduty:
+            table[low - min_:high - min_ + 1] = array('b', [lowduty]) * (high - low + 1)
+        elif high - low == 1:
+            table[low - min_]  = lowduty
+            table[high - min_] = highduty
+        else:
+            middle = (low + high) // 2
+            middleduty = dutycycle(middle)
+            ranges.append((low, middle, lowduty, middleduty))
+            ranges.append((middle, high, middleduty, highduty))
+    return table
+
 class RelPosController(object):
     """Uses key events from an xbox controller to position the motor in discrete steps.
     
@@ -128,9 +218,10 @@ class RelPosController(object):
             import evdev.ecodes
             self._right = evdev.ecodes.ecodes[right]
         else:
-            self._rigth = right
+            self._right = right
         
-        self._xcevents.add_callback(self._callback)
+        self._xcevents.add_callback(self._callback, (EV_KEY, self._left))
+        self._xcevents.add_callback(self._callback, (EV_KEY, self._right))
         self._motor.Duty_Cycle_SP = 50
         self._increment  = str(increment)
         self._mincrement = str(-increment)
@@ -173,15 +264,13 @@ class XBoxStateController(object):
         else:
             self._eventcode = event
         
-        self._typecode = evdev.ecodes.ecodes['EV_ABS']
-        
         self._value = 0.0
     
         absinfo = xcevents.absinfo(self._eventcode)
         self._min = float(absinfo.min)
         self._max = float(absinfo.max)
     
-        xcevents.add_callback(self._callback)
+        xcevents.add_callback(self._callback, (EV_ABS, self._eventcode))
         
     def __get_min(self):
         return self._min
@@ -217,15 +306,14 @@ class XBoxStateController(object):
     def _callback(self, event):
         """Callback for XCEvents()
         
+        Only called with events of the axis given at construction.
+
         Args:
             event (InputEvent): Event from a controller
             
         Returns:
-            boolean: True if the event was handled. False otherwise
+            boolean: True
         """
-        if event.type!=self._typecode or event.code!=self._eventcode:
-            return False
-            
         self._value = float(event.value)
         return True
 
@@ -237,53 +325,199 @@ def printstate(scontroller):
 
 
 
-class PController(object):
-    """Proportional controller
+class PIDController(object):
+    """Proportional-integral-derivative controller
 
-    Object that implements a proportional controller and
-    a feedback loop.
+    Object that implements a PID controller and a feedback loop that
+    runs at a fixed rate.
+
+    The loop is scheduled against absolute deadlines on a monotonic
+    clock, so the time an iteration takes does not lower the rate. When an
+    iteration overruns its deadline, `overrun` decides what happens:
+    'skip' drops the missed iterations and continues at the next deadline
+    in phase, 'catchup' runs the missed iterations right away.
+
+    The derivative is taken of the process variable rather than of the
+    error, so changes of the setpoint do not kick the output. The
+    integral stops growing while the output is clamped to `outlimits` in
+    the direction of the error (anti-windup).
 
     Args:
         kp (float): Proportional gain
         setpoint (callable): Called to get the current setpoint
         pv (callable): Called to get the current value of the process variable
         out (callable): Called with the current control value
+        ki (float): Integral gain, per second
+        kd (float): Derivative gain, in seconds
+        freq (float): Frequency of the control loop in Hz
+        outlimits (tpl of float or None): Lower and upper bound of the control
+            value, None for no bounds
+        overrun (str): Either 'skip' or 'catchup'
+        stats (bool): Record the timing of each iteration in `stats`
+
+    Raises:
+        ValueError: On a non-positive frequency or an unknown overrun policy
     """
-    def __init__(self, kp, setpoint, pv, out):
+    def __init__(self, kp, setpoint, pv, out, ki=0.0, kd=0.0, freq=60.0,
+                 outlimits=None, overrun='skip', stats=True):
+        if freq <= 0:
+            raise ValueError("Expected positive frequency")
+        if overrun not in ('skip', 'catchup'):
+            raise ValueError("Unknown overrun policy '%(p)s'"%{'p': overrun})
+
         self._kp       = kp
+        self._ki       = ki
+        self._kd       = kd
         self._out      = out
         self._setpoint = setpoint
         self._pv       = pv
+        self._overrun  = overrun
+
+        if outlimits is None:
+            self._outmin, self._outmax = None, None
+        else:
+            self._outmin, self._outmax = outlimits
 
         # Frequency of the control loop
         #
-        self._freq = 60.0
+        self._freq = float(freq)
+
+        # State of the integral and derivative terms
+        #
+        self._integral = 0.0
+        self._lastpv   = None
+        self._lasttime = None
 
-        # Thread on which the control loop is executed
+        # Number of deadlines missed and the timing of the iterations
+        #
+        self._overruns = 0
+        self._stats    = LoopStats(1.0/self._freq) if stats else None
+
+        # Thread on which the control loop is executed and the event
+        # that stops it
         #
         self._thread = None
+        self._stop   = None
+
+    def _get_freq(self):
+        return self._freq
+
+    freq = property(_get_freq)
+    """Frequency of the control loop in Hz
+    """
 
-        # Flag to terminate the control loop
+    def _get_overruns(self):
+        return self._overruns
+
+    overruns = property(_get_overruns)
+    """Number of iterations that did not finish before the next deadline
+    """
+
+    def _get_stats(self):
+        return self._stats
+
+    stats = property(_get_stats)
+    """Timing of the iterations (loopstats.LoopStats), None if not recorded
+    """
+
+    def _get_integral(self):
+        return self._integral
+
+    integral = property(_get_integral)
+    """Current value of the integral term
+    """
+
+    def reset(self):
+        """Clear the integral and derivative state
+        """
+        self._integral = 0.0
+        self._lastpv   = None
+        self._lasttime = None
+
+    def _clamp(self, control):
+        if self._outmax is not None and control > self._outmax:
+            return self._outmax
+        if self._outmin is not None and control < self._outmin:
+            return self._outmin
+        return control
+
+    def step(self, now=None):
+        """Run one iteration of the controller
+
+        Reads the setpoint and the process variable, computes the control
+        value and passes it to `out`. The time step is measured from the
+        previous call.
+
+        Args:
+            now (float or None): Time of `clock.monotonic()` the iteration is
+                due, None for the current time
+
+        Returns:
+            float: The control value
+        """
+        start = monotonic()
+        if now is None:
+            now = start
+
+        # Get input
+        #
+        pv = self._pv()
+        sp = self._setpoint()
+        inputdone = monotonic()
+        error = sp - pv
+
+        if self._lasttime is None:
+            dt = 1.0/self._freq
+            derivative = 0.0
+        else:
+            dt = now - self._lasttime
+            derivative = (pv - self._lastpv)/dt if dt > 0 else 0.0
+        self._lastpv, self._lasttime = pv, now
+
+        # Integrate only while that does not push the output further into
+        # saturation
+        #
+        integral = self._integral + self._ki*error*dt
+        control  = self._kp*error + integral - self._kd*derivative
+        clamped  = self._clamp(control)
+        if clamped == control or (clamped > control) == (error > 0):
+            self._integral = integral
+        else:
+            clamped = self._clamp(self._kp*error + self._integral - self._kd*derivative)
+        computedone = monotonic()
+
+        # Output control value
         #
-        self._continue = None
+        self._out(clamped)
+        if self._stats is not None:
+            self._stats.record(now, start, inputdone, computedone, monotonic())
+        return clamped
 
     def _controlloop(self):
         """The control loop
         """
-        import time
+        self.run(self._stop)
 
-        while self._continue:
+    def run(self, stop):
+        """Run the control loop on the calling thread until `stop` is set
 
-            # Get input
-            #
-            pv = self._pv()
-            sp = self._setpoint()
-
-            # Output control value
-            #
-            self._out(self._kp*(sp - pv))
-
-            time.sleep(1.0/self._freq)
+        Args:
+            stop (threading.Event or multiprocessing.Event): Event that stops the loop
+        """
+        period   = 1.0/self._freq
+        deadline = monotonic()
+        while not stop.is_set():
+            self.step(deadline)
+
+            deadline += period
+            now = monotonic()
+            if deadline < now:
+                self._overruns += 1
+                if self._overrun == 'skip':
+                    deadline += ((now - deadline) // period + 1) * period
+                else:
+                    continue
+            stop.wait(deadline - now)
 
     def __enter__(self):
         """Start a thread and start the control loop on it
@@ -296,9 +530,12 @@ class PController(object):
             raise RuntimeError("Controller already running")
 
         import threading
+        self.reset()
+        if self._stats is not None:
+            self._stats.reset()
+        self._stop = threading.Event()
         self._thread = threading.Thread(target=self._controlloop)
-        self._thread.deamon = True
-        self._continue = True
+        self._thread.daemon = True
         self._thread.start()
 
         return self
@@ -306,10 +543,25 @@ class PController(object):
     def __exit__(self, type_, value, traceback):
         """Stop the control loop
         """
-        self._continue = False
+        self._stop.set()
         self._thread.join()
         self._thread = None
 
+class PController(PIDController):
+    """Proportional controller
+
+    A `PIDController` without integral and derivative terms, running
+    at 60 Hz.
+
+    Args:
+        kp (float): Proportional gain
+        setpoint (callable): Called to get the current setpoint
+        pv (callable): Called to get the current value of the process variable
+        out (callable): Called with the current control value
+    """
+    def __init__(self, kp, setpoint, pv, out):
+        super(PController, self).__init__(kp, setpoint, pv, out)
+
 def clampedcontrol(motor, maxcontrol):
     """Create a function that clamps an input signal before
     its forwarded to a motor
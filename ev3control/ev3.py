@@ -4,92 +4,523 @@ Evan Goris
 2015
 """
 
-class TachoMotor(object):
-    """Represents a motor connected to a port
-    
-    Responsibilities:
-        Resource management (file handles for reading and writing to the motor)
-        
-    Abstractions:
-        To some extend the fact that we access the motor via file handles
-        
+import threading
+from array import array
+
+from .clock import monotonic
+from .sysfs import default_backend
+
+
+class AttributePool(object):
+    """Pool of open file descriptors to the attributes of a device
+
+    Each attribute is opened on first access and stays open until it is
+    evicted or the pool is closed. Values are read with positioned reads so
+    a descriptor can be reused without seeking.
+
+    The pool can be shared by threads. Opening, evicting and closing
+    handles and the reads and writes through them are serialized by a
+    lock, so a handle is never closed while in use and the buffer an
+    integer attribute is read into is never written by two reads at once.
+
     Args:
-        port (str): Port with a connected tacho-motor, either 'A', 'B', 'C', or 'D'.
-        
-    Raises:
-        IOError: When no motor on `port` can be found.
+        backend (sysfs.Backend): Backend that provides the attributes
+        folder (str): Folder of the device
+        maxsize (int or None): Maximum number of descriptors kept open at the
+            same time. When exceeded the least recently used descriptor is
+            closed. None means unbounded.
     """
-    _basefolder = "/sys/class/tacho-motor"
+    def __init__(self, backend, folder, maxsize=None):
+        if maxsize is not None and maxsize < 1:
+            raise ValueError("maxsize should be at least 1")
+
+        import collections
+        self._backend = backend
+        self._folder  = folder
+        self._maxsize = maxsize
+        self._lock    = threading.Lock()
+
+        # Mapping of attribute name to backend handle, ordered
+        # from least to most recently used
+        #
+        self._handles = collections.OrderedDict()
 
-    def __init__(self, port):
-                
-        # Folder with all files for controling and reading the motor
+        # Mapping of attribute name to a function that reads
+        # it as an integer, see `readint()`
         #
-        self._motorfolder   = self._findmotor(port)
-        
-        # File handles to file to set speed etc. Is initialized in __enter__()
+        self._intreaders = {}
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, attribute):
+        return attribute in self._handles
+
+    def handle(self, attribute):
+        """Handle for `attribute`, opened if necessary
+
+        Args:
+            attribute (str): Name of the attribute
+
+        Returns:
+            object: Open backend handle
+        """
+        with self._lock:
+            return self._handle(attribute)
+
+    def _handle(self, attribute):
+        """`handle()`, with the lock held
+        """
+        handles = self._handles
+
+        # Without a maximum size the order of use is irrelevant
         #
-        self._duty_cycle_sp = None
-        
-    def _findmotor(self,port):
-        """Look for a motor connected to `port`.
-        
+        if self._maxsize is None:
+            try:
+                return handles[attribute]
+            except KeyError:
+                handle = handles[attribute] = self._backend.open(self._folder, attribute)
+                return handle
+
+        try:
+            handle = handles.pop(attribute)
+        except KeyError:
+            handle = self._backend.open(self._folder, attribute)
+            if len(handles) >= self._maxsize:
+                evicted, evictedhandle = handles.popitem(last=False)
+                self._intreaders.pop(evicted, None)
+                self._backend.close(evictedhandle)
+        handles[attribute] = handle
+        return handle
+
+    def read(self, attribute):
+        """Read the value of an attribute
+
+        Returns:
+            str: Value of the attribute without trailing newline
+        """
+        with self._lock:
+            return self._backend.pread(self._handle(attribute))
+
+    def write(self, attribute, value):
+        """Write a value to an attribute
+
         Args:
-            port (str): Port on which to look for a motor, either 'A', 'B', 'C', or 'D'.
+            attribute (str): Name of the attribute
+            value (str): Value to write
+        """
+        with self._lock:
+            self._backend.pwrite(self._handle(attribute), value)
 
-        Raises:
-            IOError: When no motor on `port` can be found.
+    def readint(self, attribute):
+        """Read the value of an integer attribute
+
+        The value is read into a buffer allocated when the attribute is
+        first read, see `sysfs.Backend.intreader()`.
+
+        Returns:
+            int: Value of the attribute
         """
-        import os
-        if not port[:3]=="out":
-            port = "out" + port
-        
-        # Run through all connected motors and see whether they
-        # are connected to `port`
+        with self._lock:
+            try:
+                reader = self._intreaders[attribute]
+            except KeyError:
+                reader = self._intreaders[attribute] = self._backend.intreader(self._handle(attribute))
+            else:
+                if self._maxsize is not None:
+                    self._handle(attribute)
+            return reader()
+
+    def discard(self, attribute):
+        """Close the handle of an attribute if it is open
+        """
+        with self._lock:
+            self._intreaders.pop(attribute, None)
+            handle = self._handles.pop(attribute, None)
+            if handle is not None:
+                self._backend.close(handle)
+
+    def close(self):
+        """Close all open handles
+        """
+        with self._lock:
+            self._intreaders.clear()
+            while self._handles:
+                self._backend.close(self._handles.popitem()[1])
+
+
+class SetpointWriter(object):
+    """Writes setpoints to an attribute, skipping redundant writes
+
+    A value equal to the last value written is not written again. With a
+    coalescing window, a value that arrives within `window` seconds of the
+    previous write is held back, unless a newer value replaces it first.
+    A thread of the writer writes the held back value when the window
+    ends, so only the newest value reaches the attribute, at most
+    `window` seconds late. The thread runs while values are held back and
+    ends when there are none left. `flush()` writes a held back value
+    right away.
+
+    Args:
+        write (callable): Called with a value (str) to write it to the attribute.
+            Should be safe to call from another thread, e.g. a write through
+            an `AttributePool`.
+        window (float): Coalescing window in seconds, 0 disables coalescing
+
+    Attributes:
+        written (int): Number of values written
+        suppressed (int): Number of values not written because they were
+            equal to the last value written
+        coalesced (int): Number of values not written because a newer
+            value arrived within the window
+    """
+    def __init__(self, write, window=0.0):
+        self._write     = write
+        self._window    = window
+        self._lock      = threading.Condition(threading.Lock())
+
+        # Last value that reached the attribute, None if unknown
         #
-        for motor in os.listdir(TachoMotor._basefolder):
-            motor = os.path.join(TachoMotor._basefolder,motor)
-         
-            # Read the port_name atrribute and see if its equal
-            # to `port`
+        self._last      = None
+        self._lastwrite = None
+
+        # Value held back until the window ends and the thread that writes it
+        #
+        self._pending   = None
+        self._flusher   = None
+
+        self.written    = 0
+        self.suppressed = 0
+        self.coalesced  = 0
+
+    def set(self, value):
+        """Write `value` unless it is redundant or held back
+
+        Args:
+            value (str): Value to write
+        """
+        with self._lock:
+            if self._pending is not None:
+                # `value` replaces the held back value
+                #
+                self._pending = None
+                self.coalesced += 1
+
+            if value == self._last:
+                self.suppressed += 1
+                return
+
+            if self._window:
+                if self._lastwrite is not None and monotonic() - self._lastwrite < self._window:
+                    self._pending = value
+                    if self._flusher is None:
+                        self._flusher = threading.Thread(target=self._flushloop)
+                        self._flusher.daemon = True
+                        self._flusher.start()
+                    return
+
+            self._writenow(value)
+
+    def _writenow(self, value):
+        self._write(value)
+        self._last = value
+        self.written += 1
+        if self._window:
+            self._lastwrite = monotonic()
+
+    def _flushloop(self):
+        """Write held back values when their window ends, until none are left
+
+        A failed write is retried a window later.
+        """
+        retry = None
+        with self._lock:
+            while self._pending is not None:
+                due = self._lastwrite + self._window
+                if retry is not None:
+                    due = max(due, retry)
+                delay = due - monotonic()
+                if delay > 0:
+                    self._lock.wait(delay)
+                    continue
+                try:
+                    self._writenow(self._pending)
+                except (IOError, OSError):
+                    retry = monotonic() + self._window
+                    continue
+                self._pending = None
+                retry = None
+            self._flusher = None
+
+    def flush(self):
+        """Write a held back value now
+
+        For when the value should not wait for the end of the window, e.g.
+        before a motor is closed.
+        """
+        with self._lock:
+            value = self._pending
+            if value is None:
+                return
+
+            # The value stays pending when the write fails
             #
-            with open(os.path.join(motor,'address'),'r') as handle:
-                portname = handle.read()
-                portname = portname[0:-1]
-                if portname == port:
-                    return motor
-                    
-        raise IOError("No motor on port %(p)s found"%{'p':port})
-    
+            self._writenow(value)
+            self._pending = None
+
+    def prepare(self, value):
+        """Prepare to write `value` by other means
+
+        A held back value is dropped since it is older than `value`. Call
+        `record()` once the write succeeded, or `invalidate()` if it failed.
+
+        Returns:
+            bool: False if `value` equals the last value written, so need not
+                be written. It then counts as suppressed.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending = None
+                self.coalesced += 1
+            if value == self._last:
+                self.suppressed += 1
+                return False
+            return True
+
+    def record(self, value):
+        """Note that `value` was written to the attribute by other means
+
+        A held back value is dropped since it is older than `value`.
+        """
+        with self._lock:
+            self._pending = None
+            self._last    = value
+            self.written += 1
+            if self._window:
+                self._lastwrite = monotonic()
+
+    def invalidate(self):
+        """Forget the last value written and drop a held back value
+
+        To be called when the attribute may have changed by other means,
+        e.g. when the device is reset.
+        """
+        with self._lock:
+            self._pending = None
+            self._last    = None
+
+
+def _splitflags(value):
+    """Parse a space separated list of flags, e.g. the 'state' attribute
+    """
+    return value.split(' ') if value else []
+
+
+class MotorSnapshot(object):
+    """Values of several motor attributes read back-to-back
+
+    Attributes that were not part of the snapshot are None.
+
+    Attributes:
+        timestamp (float): `clock.monotonic()` at the start of the reads
+        position (int): Position in tacho counts
+        position_sp (int): Position setpoint in tacho counts
+        speed (int): Speed in tacho counts per second
+        speed_sp (int): Speed setpoint in tacho counts per second
+        duty_cycle (int): Duty cycle in percents
+        duty_cycle_sp (int): Duty cycle setpoint in percents
+        state (list of str): Run state flags, e.g. ['running', 'ramping']
+    """
+    __slots__ = ('timestamp', 'position', 'position_sp', 'speed', 'speed_sp',
+                 'duty_cycle', 'duty_cycle_sp', 'state')
+
+    def __init__(self, timestamp):
+        self.timestamp     = timestamp
+        self.position      = None
+        self.position_sp   = None
+        self.speed         = None
+        self.speed_sp      = None
+        self.duty_cycle    = None
+        self.duty_cycle_sp = None
+        self.state         = None
+
+    def __repr__(self):
+        values = ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
+        return 'MotorSnapshot(%s)' % values
+
+
+class Device(object):
+    """A device of some class, e.g. a tacho motor or a lego sensor
+
+    Finds the device on a port and manages access to its attributes.
+    Within a `with` block every attribute is opened once and kept open in
+    an `AttributePool`. Outside of it, or when `pooled` is False, each
+    access opens and closes the attribute file.
+
+    Args:
+        port (str): Port with a connected device, with or without the prefix
+            of the device class (e.g. 'A' or 'outA' for a motor)
+        backend (sysfs.Backend or None): Backend that provides the device.
+            None means `sysfs.default_backend()`.
+        maxhandles (int or None): Maximum number of attribute files kept open
+            at the same time. None means unbounded.
+        pooled (bool): If False, keep opening attribute files on every access
+            even within a `with` block.
+
+    Raises:
+        IOError: When no device on `port` can be found.
+    """
+
+    # To be set by sub-classes: name of the device class, prefix
+    # of its port names and how to refer to a device in messages
+    #
+    _classname  = None
+    _portprefix = None
+    _kind       = "device"
+
+    def __init__(self, port, backend=None, maxhandles=None, pooled=True):
+        self._backend    = backend or default_backend()
+
+        # Folder with all files for controling and reading the device
+        #
+        self._folder     = self._finddevice(str(port))
+
+        self._maxhandles = maxhandles
+        self._pooled     = pooled
+
+        # Pool of open attribute files. Is initialized in __enter__()
+        #
+        self._pool       = None
+
+    def _finddevice(self, port):
+        """Look for a device connected to `port`.
+
+        Raises:
+            IOError: When no device on `port` can be found.
+        """
+        if not port.startswith(self._portprefix):
+            port = self._portprefix + port
+
+        folder = self._backend.registry(self._classname).find(port)
+        if folder is not None:
+            return folder
+
+        raise IOError("No %(k)s on port %(p)s found"%{'k': self._kind, 'p': port})
+
     def __str__(self):
-        return self._motorfolder
-    
+        return self._folder
+
+    def _get_folder(self):
+        return self._folder
+
+    folder = property(_get_folder)
+    """Folder of the device on its backend
+    """
+
+    def _get_backend(self):
+        return self._backend
+
+    backend = property(_get_backend)
+    """Backend that provides the device
+    """
+
     def __enter__(self):
         """
-        Open 'duty_cycle_sp' in read/write mode
-        if they not already are.
+        Create a pool of attribute handles if there
+        is not one already.
         """
-        import os
-        if self._duty_cycle_sp==None:
-            mdpath = os.path.join(self._motorfolder,"duty_cycle_sp")
-            self._duty_cycle_sp = open(mdpath, 'r+')
-        
+        if self._pool is None and self._pooled:
+            self._pool = AttributePool(self._backend, self._folder, self._maxhandles)
         return self
-        
+
     def __exit__(self, type_, value, traceback):
         """Close any managed file handles.
         """
-        if self._duty_cycle_sp:
-            self._duty_cycle_sp.close()
-            self._duty_cycle_sp = None
-            
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _write_file(self, file, value):
+        if self._pool is not None:
+            self._pool.write(file, value)
+            return
+        self._backend.write(self._folder, file, value)
+
+    def _read_file(self, file):
+        if self._pool is not None:
+            return self._pool.read(file)
+        return self._backend.read(self._folder, file)
+
+    def _read_int(self, file):
+        if self._pool is not None:
+            return self._pool.readint(file)
+        return int(self._backend.read(self._folder, file))
+
     def _get_address(self):
-        """Name of the port this motor is connected to
+        """Name of the port this device is connected to
         """
         return self._read_file('address')
 
     Address = property(_get_address)
 
+    def _get_driver_name(self):
+        """Returns the name of the driver that provides this device
+        """
+        return self._read_file('driver_name')
+
+    Driver_Name = property(_get_driver_name)
+
+
+class TachoMotor(Device):
+    """Represents a motor connected to a port
+    
+    Responsibilities:
+        Resource management (file handles for reading and writing to the motor)
+        
+    Abstractions:
+        To some extend the fact that we access the motor via file handles
+
+    See `Device` for how attributes are accessed.
+        
+    Args:
+        port (str): Port with a connected tacho-motor, either 'A', 'B', 'C', or 'D'.
+        maxhandles (int or None): Maximum number of attribute files kept open
+            at the same time. None means unbounded.
+        pooled (bool): If False, keep opening attribute files on every access
+            even within a `with` block.
+        backend (sysfs.Backend or None): Backend that provides the motor.
+            None means `sysfs.default_backend()`.
+        coalesce (float): Window in seconds within which duty cycle setpoints
+            are coalesced, see `SetpointWriter`. 0 means every setpoint that
+            differs from the previous one is written immediately.
+        
+    Raises:
+        IOError: When no motor on `port` can be found.
+    """
+    _classname  = "tacho-motor"
+    _portprefix = "out"
+    _kind       = "motor"
+
+    def __init__(self, port, maxhandles=None, pooled=True, backend=None, coalesce=0.0):
+        super(TachoMotor, self).__init__(port, backend, maxhandles, pooled)
+
+        # Skips redundant writes of the duty cycle setpoint
+        #
+        self._duty_cycle_sp = SetpointWriter(
+            lambda duty_cycle: self._write_file('duty_cycle_sp', duty_cycle), coalesce)
+        
+    def __exit__(self, type_, value, traceback):
+        """Write a held back setpoint and close any managed file handles.
+        """
+        self._duty_cycle_sp.flush()
+        super(TachoMotor, self).__exit__(type_, value, traceback)
+
+    def flush(self):
+        """Write a held back duty cycle setpoint now, rather than at the
+        end of the coalescing window. See `SetpointWriter.flush()`.
+        """
+        self._duty_cycle_sp.flush()
+
     def _get_command(self):
         raise RuntimeError("Command is a write only property")
 
@@ -100,6 +531,8 @@ class TachoMotor(object):
             command (str): Command to send
         """
         self._write_file('command',command)
+        if command == 'reset':
+            self._duty_cycle_sp.invalidate()
 
     Command = property(_get_command, _set_command)
 
@@ -120,24 +553,17 @@ class TachoMotor(object):
         Returns:
             int: Number of tacho counts in one rotation
         """
-        return int(self._read_file('count_per_rot'))
+        return self._read_int('count_per_rot')
 
     Count_Per_Rot = property(_get_count_per_rot)
 
-    def _get_driver_name(self):
-        """Returns the name of the driver that provides this tacho motor device
-        """
-        return self._read_file('driver_name')
-
-    Driver_Name = property(_get_driver_name)
-
     def _get_duty_cycle(self):
         """Returns the current duty cycle of the motor
 
         Returns:
             int: Duty cycle in percents. Can be negative
         """
-        return int(self._read_file('duty_cycle'))
+        return self._read_int('duty_cycle')
 
     Duty_Cycle = property(_get_duty_cycle)
 
@@ -147,26 +573,35 @@ class TachoMotor(object):
         Returns:
             int: Duty cycle setpoint in percents. Can be negative
         """
-        if self._duty_cycle_sp:
-            self._duty_cycle_sp.seek(0)
-            return int(self._duty_cycle_sp.read())
-        else:
-            return int(self._read_file('duty_cycle_sp'))
+        return self._read_int('duty_cycle_sp')
 
     def _set_duty_cycle_sp(self, duty_cycle):
         """Sets the duty cycle setpoint
 
+        The value is not written if it equals the last value written, and
+        may be held back when coalescing is enabled.
+
         Args:
             duty_cycle_sp (int or str): Duty cycle setpoint in percents. Can be negative
         """
-        if self._duty_cycle_sp:
-            self._duty_cycle_sp.write(str(duty_cycle))
-            self._duty_cycle_sp.flush()
-        else:
-            self._write_file('duty_cycle_sp', str(duty_cycle))
+        self._duty_cycle_sp.set(str(int(duty_cycle)))
 
     Duty_Cycle_SP = property(_get_duty_cycle_sp,_set_duty_cycle_sp)
 
+    def _get_suppressed_writes(self):
+        """Number of duty cycle setpoints not written because they were equal to the last one
+        """
+        return self._duty_cycle_sp.suppressed
+
+    suppressed_writes = property(_get_suppressed_writes)
+
+    def _get_coalesced_writes(self):
+        """Number of duty cycle setpoints not written because a newer one replaced them
+        """
+        return self._duty_cycle_sp.coalesced
+
+    coalesced_writes = property(_get_coalesced_writes)
+
     def _get_encoder_polarity(self):
         """The polarity of the rotary encoder
 
@@ -213,7 +648,7 @@ class TachoMotor(object):
         Returns:
             int: The position of the motor in tacho counts
         """
-        return int(self._read_file('position'))
+        return self._read_int('position')
 
     def _set_position(self, position):
         """Set the position of the motor. Note that this does not
@@ -232,7 +667,7 @@ class TachoMotor(object):
         Returns:
             int: The position setpoint in tacho counts
         """
-        return int(self._read_file('position_sp'))
+        return self._read_int('position_sp')
 
     def _set_position_sp(self, position):
         """Set the position setpoint
@@ -250,7 +685,7 @@ class TachoMotor(object):
         Returns:
             int: Speed of the motor in tacho counts per second
         """
-        return int(self._read_file('speed'))
+        return self._read_int('speed')
 
     Speed = property(_get_speed)
 
@@ -270,7 +705,7 @@ class TachoMotor(object):
         Returns:
             int: Speed setpoint in tacho counts per second
         """
-        return int(self._read_file('speed_sp'))
+        return self._read_int('speed_sp')
 
     Speed_SP = property(_get_speed_sp, _set_speed_sp)
 
@@ -289,17 +724,70 @@ class TachoMotor(object):
     Speed_Regulation_Enabled = property(_get_speed_regulation_enabled, _set_speed_regulation_enabled)
 
 
+    def _get_state(self):
+        """Run state of the motor
+
+        Returns:
+            list of str: Zero or more of 'running', 'ramping', 'holding' and 'stalled'
+        """
+        return _splitflags(self._read_file('state'))
+
+    State = property(_get_state)
+
+    # Attributes that can be part of a snapshot and the
+    # function that parses their value
+    #
+    _snapshotfields = {
+        'position':      int,
+        'position_sp':   int,
+        'speed':         int,
+        'speed_sp':      int,
+        'duty_cycle':    int,
+        'duty_cycle_sp': int,
+        'state':         _splitflags,
+    }
+
+    def snapshot(self, fields=('position', 'speed', 'duty_cycle', 'state')):
+        """Read several attributes back-to-back
+
+        Within a `with` block the reads go over the cached attribute
+        handles, which is considerably cheaper than reading the
+        corresponding properties one by one.
+
+        Args:
+            fields (sequence of str): Attributes to read. See `MotorSnapshot`
+                for the possible values.
+
+        Returns:
+            MotorSnapshot: The values with a single timestamp
+
+        Raises:
+            ValueError: When a field can not be part of a snapshot
+        """
+        parsers = self._snapshotfields
+        for field in fields:
+            if field not in parsers:
+                raise ValueError("'%(f)s' can not be part of a snapshot"%{'f': field})
+
+        read     = self._read_file
+        readint  = self._read_int
+        snapshot = MotorSnapshot(monotonic())
+        for field in fields:
+            parser = parsers[field]
+            if parser is int:
+                setattr(snapshot, field, readint(field))
+            else:
+                setattr(snapshot, field, parser(read(field)))
+        return snapshot
+
     def get_motorfolder(self):
-        return self._motorfolder
+        return self._folder
         
     motorfolder = property(get_motorfolder)
 
     
     def reset(self):
-        import os
-        cmd = os.path.join(self._motorfolder,'command')
-        with open(cmd,'w') as c:
-            c.write('reset')
+        self.Command = 'reset'
         
 
     
@@ -340,18 +828,6 @@ class TachoMotor(object):
     def runtoabspos(self):
         self.Command = 'run-to-abs-pos'
         
-    def _write_file(self,file,value):
-        import os
-        cmdpath = os.path.join(self._motorfolder, file)
-        with open(cmdpath,'w') as cmd:
-            cmd.write(value)
-    
-    def _read_file(self,file):
-        import os
-        cmdpath = os.path.join(self._motorfolder,file)
-        with open(cmdpath,'r') as cmd:
-            return cmd.read()[0:-1]
-        
 
     def stop(self):
         self.Command = 'stop'
@@ -363,90 +839,277 @@ class TachoMotor(object):
         self.Command = 'run-direct'
 
 
-class Infrared_Sensor(object):
+class MotorGroup(object):
+    """Several motors that receive commands and setpoints together
 
-    _basefolder = "/sys/class/lego-sensor"
-    _maxvalues  = 8
+    Within a `with` block the 'command' and 'duty_cycle_sp' attributes of
+    every member are kept open, and a command or a set of setpoints is
+    written to all members in a tight loop. The time between the first and
+    the last write completing is available as `skew`.
 
-    def __init__(self, port):
-        self._sensorfolder = self._findsensor(str(port))
-        self._valuefps     = [ None for i in range(Infrared_Sensor._maxvalues) ]
+    Args:
+        motors (sequence of TachoMotor): Members of the group
+    """
+    def __init__(self, motors):
+        self._motors = list(motors)
+
+        # Per member, the write function of its backend and the handles of
+        # 'command' and 'duty_cycle_sp'. Are initialized in __enter__()
+        #
+        self._commands  = None
+        self._setpoints = None
+
+        self._skew = None
 
     def __enter__(self):
-        import os.path
-        for i in range(8):
-            self._valuefps[i] = open(os.path.join(self._sensorfolder, 'value%(n)d'%{'n':i}))
+        """Open the command and setpoint attributes of all members
+        """
+        if self._commands is None:
+            commands, setpoints = [], []
+            try:
+                for motor in self._motors:
+                    backend = motor._backend
+                    commands.append((backend, backend.open(motor._folder, 'command')))
+                    setpoints.append((backend, backend.open(motor._folder, 'duty_cycle_sp')))
+            except:
+                for backend, handle in commands + setpoints:
+                    backend.close(handle)
+                raise
+            self._commands, self._setpoints = commands, setpoints
+        return self
 
     def __exit__(self, type_, value, traceback):
-        for fp in self._valuefps:
-            if fp:
-                fp.close()
-        self._valuefps = [ None for i in range(Infrared_Sensor._maxvalues) ]
+        """Close the attributes opened by __enter__()
+        """
+        if self._commands is not None:
+            for backend, handle in self._commands + self._setpoints:
+                backend.close(handle)
+            self._commands, self._setpoints = None, None
 
-    def _findsensor(self, port):
-        """Look for a sensor connected to `port`.
+    def __len__(self):
+        return len(self._motors)
 
-        Args:
-            port (int): Port on which to look for a sensor, either 1, 2, 3, or 4.
+    def _get_motors(self):
+        return list(self._motors)
+
+    motors = property(_get_motors)
+    """Members of the group
+    """
+
+    def _get_skew(self):
+        return self._skew
+
+    skew = property(_get_skew)
+    """Seconds between the first and the last write of the most recent
+    command or set of setpoints, None if nothing was written yet
+    """
+
+    def _writeall(self, handles, values):
+        """Write values[i] to handles[i] for all members
 
         Raises:
-            IOError: When no sensor on `port` can be found.
+            RuntimeError: When not in a `with` block
         """
-        import os
-        if not port[:2]=="in":
-            port = "in" + port
+        if handles is None:
+            raise RuntimeError("MotorGroup should be used in a with block")
+
+        clock = monotonic
+        first = None
+        for (backend, handle), value in zip(handles, values):
+            backend.pwrite(handle, value)
+            if first is None:
+                first = clock()
+        self._skew = clock() - first
+
+    def command(self, command):
+        """Send the same command to every member
+
+        Args:
+            command (str): Command to send, see `TachoMotor.Commands`
+        """
+        self._writeall(self._commands, [command] * len(self._motors))
+        if command == 'reset':
+            for motor in self._motors:
+                motor._duty_cycle_sp.invalidate()
+
+    def set_duty_cycles(self, duty_cycles):
+        """Set the duty cycle setpoint of every member
+
+        Args:
+            duty_cycles (sequence of int): One setpoint per member, in
+                the order the members were given
+        """
+        if len(duty_cycles) != len(self._motors):
+            raise ValueError("Expected %(n)d setpoints"%{'n': len(self._motors)})
+
+        values = [ str(int(duty_cycle)) for duty_cycle in duty_cycles ]
+        self._writeall(self._setpoints, values)
+        for motor, value in zip(self._motors, values):
+            motor._duty_cycle_sp.record(value)
+
+    def run_direct(self):
+        self.command('run-direct')
+
+    def run_forever(self):
+        self.command('run-forever')
+
+    def stop(self):
+        self.command('stop')
 
-        # Run through all connected motors and see whether they
-        # are connected to `port`
+    def reset(self):
+        self.command('reset')
+
+
+class LegoSensor(Device):
+    """Represents a sensor of the lego-sensor class connected to a port
+
+    Generic for all sensors handled by the lego-sensor class, e.g. touch,
+    colour, gyro, ultrasonic and infrared sensors.
+
+    Within a `with` block the value files of the current mode are kept open,
+    and are reopened when the mode changes through `Mode`. The mode, its
+    number of values and its 'bin_data_format' are cached as well, and
+    setting the mode the sensor is already in does nothing. All
+    values of the current mode can then be read at once from the 'bin_data'
+    attribute, which takes a single read instead of one per value file.
+
+    Args:
+        port (int or str): Port with a connected sensor, either 1, 2, 3, or 4.
+        backend (sysfs.Backend or None): Backend that provides the sensor.
+            None means `sysfs.default_backend()`.
+
+    Raises:
+        IOError: When no sensor on `port` can be found.
+    """
+
+    _classname  = "lego-sensor"
+    _portprefix = "in"
+    _kind       = "sensor"
+
+    # Size of the 'bin_data' attribute
+    #
+    _bindatasize = 32
+
+    # struct format characters for the values of 'bin_data_format'
+    #
+    _binformats = {
+        'u8':     '<%(n)dB',
+        's8':     '<%(n)db',
+        'u16':    '<%(n)dH',
+        's16':    '<%(n)dh',
+        's16_be': '>%(n)dh',
+        's32':    '<%(n)di',
+        'float':  '<%(n)df',
+    }
+
+    def __init__(self, port, backend=None):
+        super(LegoSensor, self).__init__(port, backend)
+
+        # Names of the value files of the current mode and the struct
+        # that decodes 'bin_data' in the current mode. Only maintained
+        # within a `with` block
         #
-        for sensor in os.listdir(Infrared_Sensor._basefolder):
-            sensor = os.path.join(Infrared_Sensor._basefolder, sensor)
+        self._valuenames  = None
+        self._binformat   = None
+        self._binstruct   = None
+        self._bintypecode = None
 
-            # Read the port_name atrribute and see if its equal
-            # to `port`
-            #
-            with open(os.path.join(sensor, 'address'), 'r') as handle:
-                portname = handle.read()
-                portname = portname[0:-1]
-                if portname == port:
-                    return sensor
-
-        raise IOError("No sensor on port %(p)s found"%{'p':port})
-
-    def _write_file(self,file,value):
-        import os
-        cmdpath = os.path.join(self._sensorfolder, file)
-        with open(cmdpath, 'w') as cmd:
-            cmd.write(value)
-
-    def _read_file(self,file):
-        import os
-        cmdpath = os.path.join(self._sensorfolder, file)
-        with open(cmdpath, 'r') as cmd:
-            return cmd.read()[0:-1]
+        # Current mode, only cached within a `with` block
+        #
+        self._mode        = None
+
+        # Buffer 'bin_data' is read into and the function that reads it
+        #
+        self._bindata    = bytearray(LegoSensor._bindatasize)
+        self._binreader  = None
+
+    def __enter__(self):
+        if self._pool is None:
+            super(LegoSensor, self).__enter__()
+            self._mode = self._pool.read('mode')
+            self._openvalues()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        super(LegoSensor, self).__exit__(type_, value, traceback)
+        self._mode       = None
+        self._valuenames = None
+        self._binformat  = None
+        self._binstruct  = None
+        self._binreader  = None
+
+    def _openvalues(self):
+        """Open the value files the current mode provides and close the others
+
+        Also prepare decoding of 'bin_data' for the current mode, if
+        the sensor provides it.
+        """
+        import struct
+        pool = self._pool
+
+        numvalues = int(pool.read('num_values'))
+        valuenames = [ 'value%(n)d'%{'n': i} for i in range(numvalues) ]
+        for name in (self._valuenames or [])[numvalues:]:
+            pool.discard(name)
+        for name in valuenames:
+            pool.handle(name)
+        self._valuenames = valuenames
+
+        try:
+            binformat = pool.read('bin_data_format')
+            if self._binreader is None:
+                self._binreader = self._backend.bufferreader(pool.handle('bin_data'), self._bindata)
+        except (IOError, OSError):
+            self._binformat = None
+            self._binstruct = None
+            return
+
+        binstruct = struct.Struct(LegoSensor._binformats[binformat]%{'n': numvalues})
+        if binstruct.size > LegoSensor._bindatasize:
+            binstruct = None
+        self._binformat   = binformat
+        self._binstruct   = binstruct
+        self._bintypecode = 'f' if binformat == 'float' else 'i'
 
     def _get_value(self, i):
-        if self._valuefps[i]:
-            self._valuefps[i].seek(0)
-            return self._valuefps[i].read()[0:-1]
-        else:
-            return self._read_file('value%(n)d'%{'n': i})
+        return self._read_file('value%(n)d'%{'n': i})
 
-    def _get_proximity(self):
-        return self._get_value(0)
+    def read_bin_data(self):
+        """Read the raw 'bin_data' attribute
 
-    Proximity = property(_get_proximity)
+        Returns:
+            memoryview: The bytes read. A view on a buffer that is reused by
+                the next read, so copy it to keep it.
 
-    def SeekHeading(self, channel):
-        return self._get_value((channel-1)*2)
+        Raises:
+            RuntimeError: When not in a `with` block or when the sensor
+                does not provide 'bin_data'
+        """
+        if self._binreader is None:
+            raise RuntimeError("bin_data is only available within a with block on sensors that provide it")
+        return memoryview(self._bindata)[:self._binreader()]
 
-    def SeekDistance(self, channel):
-        return self._get_value((channel-1)*2 +1)
+    def read_all(self):
+        """Read every value of the current mode
 
-    def _get_address(self):
-        return self._read_file('address')
+        Within a `with` block the values are decoded from a single read of
+        'bin_data' if the sensor provides it, otherwise each value file is
+        read.
 
-    Address = property(_get_address)
+        Returns:
+            array of int or float: One value per value file of the current mode
+        """
+        binstruct = self._binstruct
+        if binstruct is not None:
+            self._binreader()
+            return array(self._bintypecode, binstruct.unpack_from(self._bindata))
+
+        if self._pool is not None:
+            readint = self._pool.readint
+            return array('i', [ readint(name) for name in self._valuenames ])
+
+        numvalues = int(self._read_file('num_values'))
+        return array('i', [ int(self._get_value(i)) for i in range(numvalues) ])
 
     def _get_modes(self):
         modes = self._read_file('modes')
@@ -455,29 +1118,82 @@ class Infrared_Sensor(object):
     Modes = property(_get_modes)
 
     def _get_mode(self):
+        if self._mode is not None:
+            return self._mode
         return self._read_file('mode')
 
     def _set_mode(self, mode):
+        if mode == self._mode:
+            return
         self._write_file('mode', mode)
+        if self._pool is not None:
+            self._mode = mode
+            self._openvalues()
 
     Mode = property(_get_mode, _set_mode)
 
     def _get_num_values(self):
+        if self._valuenames is not None:
+            return len(self._valuenames)
         return int(self._read_file('num_values'))
 
     Num_Values = property(_get_num_values)
 
-    def _get_driver_name(self):
-        return self._read_file('driver_name')
+    def _get_bin_data_format(self):
+        """Format of the values in 'bin_data'
 
-    Driver_Name = property(_get_driver_name)
+        Returns:
+            str: One of 'u8', 's8', 'u16', 's16', 's16_be', 's32' and 'float'
+        """
+        if self._binformat is not None:
+            return self._binformat
+        return self._read_file('bin_data_format')
+
+    Bin_Data_Format = property(_get_bin_data_format)
+
+
+class Infrared_Sensor(LegoSensor):
+    """Represents an infrared sensor connected to a port
+
+    See `LegoSensor`.
+
+    Args:
+        port (int or str): Port with a connected sensor, either 1, 2, 3, or 4.
+        backend (sysfs.Backend or None): Backend that provides the sensor.
+            None means `sysfs.default_backend()`.
+
+    Raises:
+        IOError: When no sensor on `port` can be found.
+    """
+
+    def __init__(self, port, backend=None):
+        super(Infrared_Sensor, self).__init__(port, backend)
+
+    def _get_proximity(self):
+        return self._get_value(0)
+
+    Proximity = property(_get_proximity)
+
+    def SeekHeading(self, channel):
+        return self._get_value((channel-1)*2)
+
+    def SeekDistance(self, channel):
+        return self._get_value((channel-1)*2 +1)
+
+    def read_beacons(self, filter=None):
+        """Heading and distance of the beacons on all four channels
+
+        See `beacons.read_beacons()`. Requires NumPy.
+        """
+        from .beacons import read_beacons
+        return read_beacons(self, filter)
 
 if __name__=='__main__':
     import time
     
     try:
         motor = TachoMotor('A')
-        print motor._motorfolder    
+        print motor.motorfolder    
         print motor.position
         print motor.duty_cycle_sp
         
@@ -0,0 +1,290 @@
+"""Recording and replay of input events
+
+An `EventRecorder` writes the events delivered by an `xbox.XCEvents` to a
+compact binary log, together with the information on the absolute axes of
+the controller. An `EventReplay` reads such a log and delivers its events
+to callbacks like an `XCEvents` does, so controllers can be run and
+benchmarked without a gamepad.
+
+A log starts with a header: the magic bytes 'EV3L', the format version and
+the number of axes (`'<4sHH'`), followed by one `'<H6i'` record per axis
+with its code and AbsInfo. Then follows one `'<dHHi'` record per event
+with its timestamp in seconds, type, code and value.
+"""
+
+import struct
+from collections import namedtuple
+
+from .clock import monotonic
+from .xbox import EventDispatcher
+
+MAGIC   = b'EV3L'
+VERSION = 1
+
+_header  = struct.Struct('<4sHH')
+_absinfo = struct.Struct('<H6i')
+_record  = struct.Struct('<dHHi')
+
+AbsInfo = namedtuple('AbsInfo', 'value min max fuzz flat resolution')
+"""Information on an absolute axis, as `evdev.AbsInfo`
+"""
+
+
+class ReplayEvent(object):
+    """Input event read from a log
+
+    Has the attributes of `evdev.InputEvent` that callbacks use.
+    """
+    __slots__ = ('sec', 'usec', 'type', 'code', 'value')
+
+    def __init__(self, timestamp, type_, code, value):
+        self.sec   = int(timestamp)
+        self.usec  = int(round((timestamp - self.sec) * 1e6))
+        self.type  = type_
+        self.code  = code
+        self.value = value
+
+    def timestamp(self):
+        return self.sec + self.usec * 1e-6
+
+    def __repr__(self):
+        return 'ReplayEvent(%(t)d, %(c)d, %(v)d)'%{'t': self.type, 'c': self.code, 'v': self.value}
+
+
+class EventRecorder(object):
+    """Records the events of an event source to a log
+
+    Registers itself as a callback of `source` at construction, after
+    writing the header. Events are recorded until `close()`, or the end
+    of a `with` block. Close only after `source` stopped delivering events.
+
+    Without a source only the events passed to `write()` are recorded,
+    e.g. to create a synthetic log.
+
+    Args:
+        source (xbox.EventDispatcher or None): Source of the events, e.g. an
+            `xbox.XCEvents`
+        path (str): File to write the log to
+        absinfos (dict or None): Mapping of axis code to AbsInfo to write to the
+            header. None for the axes of `source`.
+    """
+    def __init__(self, source, path, absinfos=None):
+        if absinfos is None:
+            absinfos = source.absinfos() if source is not None else {}
+
+        self._file  = open(path, 'wb')
+        self._count = 0
+
+        absinfos = sorted(absinfos.items())
+        self._file.write(_header.pack(MAGIC, VERSION, len(absinfos)))
+        for code, info in absinfos:
+            self._file.write(_absinfo.pack(code, *info))
+
+        if source is not None:
+            source.add_callback(self._callback)
+
+    def _get_count(self):
+        return self._count
+
+    count = property(_get_count)
+    """Number of events recorded
+    """
+
+    def write(self, timestamp, type_, code, value):
+        """Append an event to the log
+
+        Args:
+            timestamp (float): Time of the event in seconds
+            type_ (int): Type of the event, e.g. `xbox.EV_ABS`
+            code (int): Code of the event, e.g. the code of an axis
+            value (int): Value of the event
+
+        Raises:
+            ValueError: When the log is closed
+        """
+        if self._file is None:
+            raise ValueError("Event log is closed")
+        self._file.write(_record.pack(timestamp, type_, code, value))
+        self._count += 1
+
+    def _callback(self, event):
+        """Append an event delivered by the source to the log
+
+        Returns:
+            boolean: True
+        """
+        if self._file is None:
+            return False
+        timestamp = getattr(event, 'timestamp', None)
+        timestamp = timestamp() if timestamp is not None else monotonic()
+        self.write(timestamp, event.type, event.code, event.value)
+        return True
+
+    def close(self):
+        """Stop recording and close the log
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+
+def readlog(path):
+    """Read a log
+
+    Args:
+        path (str): File the log was written to
+
+    Returns:
+        tpl of (dict, list of ReplayEvent): Mapping of axis code to AbsInfo, and the events
+
+    Raises:
+        IOError: When the file is not a log of a supported version
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < _header.size:
+        raise IOError("%(p)s is not an event log"%{'p': path})
+    magic, version, naxes = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise IOError("%(p)s is not an event log"%{'p': path})
+    if version != VERSION:
+        raise IOError("Unsupported event log version %(v)d"%{'v': version})
+
+    offset = _header.size
+    absinfos = {}
+    for i in range(naxes):
+        fields = _absinfo.unpack_from(data, offset)
+        absinfos[fields[0]] = AbsInfo(*fields[1:])
+        offset += _absinfo.size
+
+    size = _record.size
+    unpack = _record.unpack_from
+    events = [ ReplayEvent(*unpack(data, o))
+               for o in range(offset, len(data) - size + 1, size) ]
+    return absinfos, events
+
+
+class EventReplay(EventDispatcher):
+    """Delivers the events of a log to callbacks, in place of an `xbox.XCEvents`
+
+    Replaying starts on a thread of its own when entering a `with` block,
+    and stops when leaving it or at the end of the log. Instead, `run()`
+    replays on the calling thread.
+
+    Args:
+        path (str): File the log was written to
+        speed (float or None): Replay speed relative to real time, e.g. 2.0 for
+            twice as fast. None to replay as fast as possible.
+        callbacks (list of callable or None): Called with every event
+    """
+    def __init__(self, path, speed=1.0, callbacks=None):
+        super(EventReplay, self).__init__(callbacks)
+        if speed is not None and speed <= 0:
+            raise ValueError("Expected positive speed")
+
+        self._absinfos, self._events = readlog(path)
+        self._speed = speed
+
+        # Thread that replays, the event that stops it and the number
+        # of events replayed by the last run
+        #
+        self._thread   = None
+        self._stop     = None
+        self._replayed = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def _get_replayed(self):
+        return self._replayed
+
+    replayed = property(_get_replayed)
+    """Number of events delivered by the last replay
+    """
+
+    def absinfos(self):
+        return dict(self._absinfos)
+
+    def _eventsequence(self):
+        """Generate the events of the log at the replay speed
+        """
+        events, speed, stop = self._events, self._speed, self._stop
+        if speed is None or not events:
+            for event in events:
+                if stop is not None and stop.is_set():
+                    return
+                yield event
+            return
+
+        # Deadlines are absolute, relative to the first event, so
+        # delivery does not drift with the time callbacks take
+        #
+        first = events[0].timestamp()
+        start = monotonic()
+        for event in events:
+            delay = start + (event.timestamp() - first) / speed - monotonic()
+            if delay > 0:
+                if stop is not None:
+                    if stop.wait(delay):
+                        return
+                else:
+                    import time
+                    time.sleep(delay)
+            elif stop is not None and stop.is_set():
+                return
+            yield event
+
+    def run(self):
+        """Replay the log on the calling thread
+
+        Offloaded callbacks have handled all events when this returns.
+
+        Returns:
+            int: Number of events delivered
+        """
+        self._startworkers()
+        try:
+            self._replayed = self._processevents()
+        finally:
+            self._stopworkers()
+        return self._replayed
+
+    def wait(self, timeout=None):
+        """Wait for a replay started by `__enter__()` to reach the end of the log
+
+        Returns:
+            bool: True if the replay ended
+        """
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def __enter__(self):
+        """Start replaying on a thread of its own
+
+        Raises:
+            RuntimeError: When already replaying
+        """
+        if self._thread:
+            raise RuntimeError("Replay already running")
+
+        import threading
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """Stop replaying
+        """
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._stop = None
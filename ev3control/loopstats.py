@@ -0,0 +1,181 @@
+"""Timing statistics of control loops
+
+A `LoopStats` records how long each phase of the iterations of a control
+loop takes, how late the loop wakes up and how late it delivers its
+output. Recording an iteration only updates a few preallocated counters,
+so it can stay enabled in production loops.
+"""
+
+from array import array
+from bisect import bisect_left
+
+# Phases of an iteration, in order
+#
+PHASES = ('input', 'compute', 'output', 'sleep')
+
+# Upper bounds in microseconds of the buckets of the latency histogram.
+# The last bucket holds everything above the last bound
+#
+BUCKETS = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+
+class LoopStats(object):
+    """Timing statistics of the iterations of a control loop
+
+    An iteration is due at its deadline, starts when the loop wakes up,
+    then reads its input, computes and writes its output, after which
+    the loop sleeps until the next deadline. The latency of an iteration
+    is the time from its deadline until its output is written. An
+    iteration overruns when its latency exceeds the period. Jitter is
+    the standard deviation of the time from deadline to wake up.
+
+    The counters are updated without locking. A `snapshot()` taken on
+    another thread may mix two consecutive iterations.
+
+    Args:
+        period (float): Nominal time in seconds between two deadlines
+        buckets (sequence of int): Upper bounds in microseconds of the
+            buckets of the latency histogram
+    """
+    def __init__(self, period, buckets=BUCKETS):
+        self._period  = float(period)
+        self._bounds  = [ b * 1e-6 for b in buckets ]
+        self._buckets = tuple(buckets)
+
+        self._totals  = array('d', [0.0] * len(PHASES))
+        self._maxima  = array('d', [0.0] * len(PHASES))
+        self._counts  = array('L', [0] * (len(buckets) + 1))
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics
+        """
+        for i in range(len(PHASES)):
+            self._totals[i] = 0.0
+            self._maxima[i] = 0.0
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+
+        self._iterations = 0
+        self._overruns   = 0
+        self._maxlatency = 0.0
+
+        # Running mean and sum of squared deviations of the wake up
+        # delay (Welford)
+        #
+        self._delaymean  = 0.0
+        self._delaym2    = 0.0
+        self._maxdelay   = 0.0
+
+        # End of the output phase of the previous iteration, the start
+        # of its sleep
+        #
+        self._lastoutput = None
+
+    def _get_period(self):
+        return self._period
+
+    period = property(_get_period)
+    """Nominal time in seconds between two deadlines
+    """
+
+    def _get_iterations(self):
+        return self._iterations
+
+    iterations = property(_get_iterations)
+    """Number of iterations recorded
+    """
+
+    def _get_overruns(self):
+        return self._overruns
+
+    overruns = property(_get_overruns)
+    """Number of iterations whose output came later than a period after their deadline
+    """
+
+    def _addphase(self, i, duration):
+        self._totals[i] += duration
+        if duration > self._maxima[i]:
+            self._maxima[i] = duration
+
+    def record(self, deadline, start, inputdone, computedone, outputdone):
+        """Record the timing of an iteration
+
+        All times are in seconds of `clock.monotonic()`.
+
+        Args:
+            deadline (float): Time the iteration was due
+            start (float): Time the iteration started
+            inputdone (float): Time the input was read
+            computedone (float): Time the output was computed
+            outputdone (float): Time the output was written
+        """
+        self._addphase(0, inputdone - start)
+        self._addphase(1, computedone - inputdone)
+        self._addphase(2, outputdone - computedone)
+        if self._lastoutput is not None:
+            self._addphase(3, start - self._lastoutput)
+        self._lastoutput = outputdone
+
+        latency = outputdone - deadline
+        self._counts[bisect_left(self._bounds, latency)] += 1
+        if latency > self._maxlatency:
+            self._maxlatency = latency
+        if latency > self._period:
+            self._overruns += 1
+
+        self._iterations += 1
+        delay = start - deadline
+        deviation = delay - self._delaymean
+        self._delaymean += deviation / self._iterations
+        self._delaym2 += deviation * (delay - self._delaymean)
+        if delay > self._maxdelay:
+            self._maxdelay = delay
+
+    def jitter(self):
+        """Standard deviation in seconds of the time from deadline to wake up
+        """
+        if self._iterations < 2:
+            return 0.0
+        return (self._delaym2 / (self._iterations - 1)) ** 0.5
+
+    def histogram(self):
+        """Latency histogram
+
+        Returns:
+            list of tpl of (int or None, int): Upper bound in microseconds of each
+                bucket, None for the last one, and the number of iterations in it
+        """
+        bounds = list(self._buckets) + [None]
+        return list(zip(bounds, self._counts))
+
+    def snapshot(self):
+        """All statistics, in a form that can be serialized as JSON
+
+        Times are in seconds.
+
+        Returns:
+            dict: 'period', 'iterations', 'overruns', 'jitter', 'max_delay',
+                'max_latency', 'phases' (per phase its 'mean' and 'max' duration)
+                and 'histogram' (see `histogram()`)
+        """
+        n = self._iterations
+        phases = {}
+        for i, phase in enumerate(PHASES):
+            # There is no sleep before the first iteration
+            #
+            count = n - 1 if phase == 'sleep' else n
+            phases[phase] = {
+                'mean': self._totals[i] / count if count > 0 else 0.0,
+                'max':  self._maxima[i],
+            }
+        return {
+            'period':      self._period,
+            'iterations':  n,
+            'overruns':    self._overruns,
+            'jitter':      self.jitter(),
+            'max_delay':   self._maxdelay,
+            'max_latency': self._maxlatency,
+            'phases':      phases,
+            'histogram':   self.histogram(),
+        }
@@ -0,0 +1,183 @@
+"""Scheduling of reads for sensors with several modes
+
+Switching the mode of a sensor takes time, and after a switch the sensor
+needs to settle before its values are valid. A `ModeScheduler` collects
+read requests tagged with the mode they need and serves them grouped per
+mode, starting with the mode the sensor is in, so each mode is switched
+to at most once per round.
+"""
+
+from .clock import monotonic
+
+
+class _ModeStats(object):
+    """Timing of the rounds that served a mode
+    """
+    __slots__ = ('reads', 'readtime', 'switches', 'switchtime')
+
+    def __init__(self):
+        self.reads      = 0
+        self.readtime   = 0.0
+        self.switches   = 0
+        self.switchtime = 0.0
+
+
+class ModeScheduler(object):
+    """Serves read requests for a multi-mode sensor, grouped per mode
+
+    Requests are served by `process()`, which is to be called regularly,
+    e.g. from a control loop or a scheduler. It never blocks to let the
+    sensor settle after a switch.
+
+    Args:
+        sensor (ev3.LegoSensor): Sensor to read. Should be in a `with` block so
+            its current mode is cached.
+        settle (dict): Mapping of mode to the time in seconds the sensor needs
+            after switching to that mode before its values are valid
+        defaultsettle (float): Settle time of modes not in `settle`
+    """
+    def __init__(self, sensor, settle=None, defaultsettle=0.0):
+        self._sensor        = sensor
+        self._settle        = dict(settle or {})
+        self._defaultsettle = float(defaultsettle)
+
+        # Per mode, one-shot requests and recurring subscriptions.
+        # Modes are served in order of their first request
+        #
+        self._requests      = {}
+        self._subscriptions = {}
+        self._order         = []
+
+        self._stats         = {}
+
+        # Time at which the sensor was last switched to another mode
+        #
+        self._switched      = None
+
+    def _enqueue(self, table, mode, callback):
+        if mode not in self._order:
+            self._order.append(mode)
+        table.setdefault(mode, []).append(callback)
+
+    def request(self, mode, callback):
+        """Read all values once in `mode`
+
+        Args:
+            mode (str): Mode the values are to be read in, e.g. 'IR-SEEK'
+            callback (callable): Called with the values (array) and the time
+                (`clock.monotonic()`) they were read
+        """
+        self._enqueue(self._requests, mode, callback)
+
+    def subscribe(self, mode, callback):
+        """Read all values in `mode` on every call of `process()`
+
+        Args:
+            mode (str): Mode the values are to be read in
+            callback (callable): See `request()`
+        """
+        self._enqueue(self._subscriptions, mode, callback)
+
+    def unsubscribe(self, mode, callback):
+        """Stop a subscription started with `subscribe()`
+        """
+        self._subscriptions[mode].remove(callback)
+
+    def settletime(self, mode):
+        """Time in seconds the sensor needs to settle in `mode`
+        """
+        return self._settle.get(mode, self._defaultsettle)
+
+    def _pendingmodes(self):
+        """Modes with requests or subscriptions, the current mode first
+        """
+        modes = [ mode for mode in self._order
+                  if self._requests.get(mode) or self._subscriptions.get(mode) ]
+        current = self._sensor.Mode
+        if current in modes:
+            modes.remove(current)
+            modes.insert(0, current)
+        return modes
+
+    def process(self):
+        """Serve the pending requests and subscriptions the sensor is ready for
+
+        Never waits for the sensor. After a switch to a mode that needs to
+        settle, the requests of that mode and of the modes after it stay
+        pending, and are served by the first call after the settle time.
+
+        Returns:
+            int: Number of callbacks called
+        """
+        served = 0
+        for mode in self._pendingmodes():
+            stats = self._stats.get(mode)
+            if stats is None:
+                stats = self._stats[mode] = _ModeStats()
+
+            if self._sensor.Mode != mode:
+                start = monotonic()
+                self._sensor.Mode = mode
+                self._switched = monotonic()
+                stats.switches += 1
+                stats.switchtime += self._switched - start
+
+            # Leave the rest to a later call if the sensor switched recently
+            #
+            if self._switched is not None and \
+               monotonic() < self._switched + self.settletime(mode):
+                break
+
+            readstart = monotonic()
+            values = self._sensor.read_all()
+            now = monotonic()
+            stats.reads += 1
+            stats.readtime += now - readstart
+
+            callbacks = self._requests.pop(mode, []) + self._subscriptions.get(mode, [])
+            for callback in callbacks:
+                callback(values, now)
+            served += len(callbacks)
+        return served
+
+    def rates(self):
+        """Sample rates achievable per mode, estimated from the rounds so far
+
+        'dedicated' is the rate when only that mode is read, so without
+        switching. 'cycling' is the rate when cycling through all modes with
+        pending requests or subscriptions, switching once per mode per round.
+
+        Returns:
+            dict: Mapping of mode to a dict with 'reads', 'switches',
+                'read_time' and 'switch_time' (means, in seconds, the latter
+                without the settle time),
+                'dedicated' and 'cycling' (in Hz)
+        """
+        def mean(total, n):
+            return total / n if n else 0.0
+
+        result = {}
+        for mode, stats in self._stats.items():
+            readtime = mean(stats.readtime, stats.reads)
+            switchtime = mean(stats.switchtime, stats.switches)
+            result[mode] = {
+                'reads':       stats.reads,
+                'switches':    stats.switches,
+                'read_time':   readtime,
+                'switch_time': switchtime,
+                'dedicated':   1.0 / readtime if readtime else float('inf'),
+            }
+
+        cycle = 0.0
+        active = self._pendingmodes()
+        for mode in active:
+            if mode in result:
+                cycle += result[mode]['read_time']
+                if len(active) > 1:
+                    cycle += result[mode]['switch_time'] + self.settletime(mode)
+        for mode in result:
+            if mode in active:
+                result[mode]['cycling'] = 1.0 / cycle if cycle else float('inf')
+            else:
+                result[mode]['cycling'] = 0.0
+        return result
@@ -1,16 +1,23 @@
 """Monitor attributes hardware
 """
 
-def duty_cycle(motor, interval=1):
+def duty_cycle(motor, interval=1, sampler=None):
     """Monitor duty cycle and speed of a motor
     
     Args:
         motor (ev3.TachoMotor): Motor to monitor
         interval (float): Time in seconds between each sample
+        sampler (sampler.MotorSampler or None): If given, take the values from
+            the samples of this sampler instead of reading them from `motor`.
+            It should sample 'duty_cycle' and 'speed'.
     """
     import time, sys
     while True:
-        sys.stderr.write('\rDuty cycle: ' + motor.Duty_Cycle + ' Speed: ' + str(int(motor.Speed)/10) + '       ')
+        if sampler:
+            duty, speed = sampler.value('duty_cycle'), sampler.value('speed')
+        else:
+            duty, speed = motor.Duty_Cycle, motor.Speed
+        sys.stderr.write('\rDuty cycle: ' + str(duty) + ' Speed: ' + str(int(speed)/10) + '       ')
         time.sleep(interval)
 
 import BaseHTTPServer
@@ -23,8 +30,10 @@ class EV3HTTPServer(BaseHTTPServer.HTTPServer):
         host (tuple of (str, int)): IP and port the server lives
         requesthandler (BaseHTTPRequestHandler.__class__): Class to instantiate upon request
         objectproperties (list of tpl of object, list of str): Objects and properties to serve info on
+        loopstats (list of tpl of str, loopstats.LoopStats): Names and timing statistics
+            of control loops to serve under 'loops'
     """    
-    def __init__(self, host, requesthandler, objectproperties=[]):
+    def __init__(self, host, requesthandler, objectproperties=[], loopstats=[]):
         BaseHTTPServer.HTTPServer.__init__(self, host, requesthandler)
 
         # Instantiate the service(s) provides by this server
@@ -36,6 +45,12 @@ class EV3HTTPServer(BaseHTTPServer.HTTPServer):
             deviceservice = ObjectService(object, object.Address, properties, statics)
             propservice.addsubservice(deviceservice)
 
+        if loopstats:
+            loopservice = DelegationService('loops')
+            self._rootservice.addsubservice(loopservice)
+            for name, stats in loopstats:
+                loopservice.addsubservice(StatsService(name, stats))
+
 
 class EV3RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
     """Request handler for a EV3HTTPServer
@@ -265,6 +280,37 @@ class ObjectService(Service):
                 values.append((time.time(), self._object.__getattribute__(arg)))
             return values
 
+class StatsService(Service):
+    """Service that provides the timing statistics of a control loop
+
+    Args:
+        name (str): Name for this service
+        stats (loopstats.LoopStats): Statistics to serve
+    """
+    def __init__(self, name, stats):
+        super(StatsService, self).__init__()
+        self._name  = name
+        self._stats = stats
+
+    def parameters(self):
+        return sorted(self._stats.snapshot().keys())
+
+    def apply(self, *args):
+        """
+        Args:
+            *args: List with keys of `LoopStats.snapshot()`
+        Returns:
+            list: List of values of the statistics in `args`
+        """
+        snapshot = self._stats.snapshot()
+        if args==():
+            snapshot['Id'] = self._name
+            return (snapshot, [], self.parameters())
+        else:
+            import time
+            now = time.time()
+            return [ (now, snapshot[arg]) for arg in args ]
+
 class DelegationService(Service):
     """Service that delegates its application to its sub-services
     """
@@ -0,0 +1,195 @@
+"""Notification of changing attribute values
+
+A `ChangeNotifier` watches device attributes on a thread of its own and
+calls back only when a value changes, so consumers do not have to poll.
+
+Some drivers signal changes of an attribute through sysfs, e.g. the
+'state' attribute of a tacho motor. Such attributes can be watched with
+`notify=True`, in which case the thread sleeps in poll() until the kernel
+reports POLLPRI. Other attributes are polled at an adaptive interval: the
+interval grows while the value stays the same and drops back to the
+minimum as soon as it changes.
+"""
+
+import os
+import threading
+
+from .clock import monotonic
+
+
+class _Watch(object):
+    """State of one watched attribute
+    """
+    __slots__ = ('device', 'attribute', 'callback', 'parse', 'handle', 'fd',
+                 'value', 'interval', 'due')
+
+    def __init__(self, device, attribute, callback, parse):
+        self.device    = device
+        self.attribute = attribute
+        self.callback  = callback
+        self.parse     = parse
+        self.handle    = None
+        self.fd        = None
+        self.value     = None
+        self.interval  = None
+        self.due       = None
+
+
+class ChangeNotifier(object):
+    """Calls back when watched attribute values change
+
+    Watching starts when entering a `with` block and stops when leaving it.
+
+    Args:
+        mininterval (float): Shortest time in seconds between two reads of a
+            polled attribute
+        maxinterval (float): Longest time in seconds between two reads of a
+            polled attribute. Attributes watched with `notify=True` are read
+            at this interval as well, in case the driver never notifies.
+        backoff (float): Factor by which the interval of a polled attribute
+            grows each time its value turns out unchanged
+    """
+    def __init__(self, mininterval=0.01, maxinterval=0.5, backoff=1.5):
+        if not 0 < mininterval <= maxinterval:
+            raise ValueError("Expected 0 < mininterval <= maxinterval")
+        if backoff < 1.0:
+            raise ValueError("backoff should be at least 1")
+
+        self._mininterval = float(mininterval)
+        self._maxinterval = float(maxinterval)
+        self._backoff     = float(backoff)
+
+        self._watches = []
+        self._lock    = threading.Lock()
+
+        # Thread that watches and the pipe that wakes it up.
+        # Are initialized in __enter__()
+        #
+        self._thread  = None
+        self._running = False
+        self._wakerfd, self._wakewfd = None, None
+
+    def watch(self, device, attribute, callback, parse=None, notify=False):
+        """Start watching an attribute
+
+        The attribute is opened and read right away. `callback` is only
+        called for later changes.
+
+        Args:
+            device (ev3.Device): Device the attribute belongs to
+            attribute (str): Name of the attribute, e.g. 'position'
+            callback (callable): Called with the new value upon a change
+            parse (callable or None): Applied to the raw value before comparing
+                and passing it on, e.g. `int`
+            notify (bool): Wait for the driver to signal changes. Ignored when
+                the backend of `device` does not use file descriptors.
+        """
+        w = _Watch(device, attribute, callback, parse)
+        backend  = device.backend
+        w.handle = backend.open(device.folder, attribute)
+        w.value  = self._read(w)
+        if notify:
+            w.fd = backend.fileno(w.handle)
+        w.interval = self._maxinterval if w.fd is not None else self._mininterval
+        w.due      = monotonic() + w.interval
+
+        with self._lock:
+            self._watches.append(w)
+        self._wake()
+
+    def _read(self, w):
+        value = w.device.backend.pread(w.handle)
+        if w.parse is not None:
+            value = w.parse(value)
+        return value
+
+    def _check(self, w):
+        """Read a watched attribute and call back if it changed
+
+        Returns:
+            bool: True if the value changed
+        """
+        value = self._read(w)
+        if value == w.value:
+            return False
+        w.value = value
+        w.callback(value)
+        return True
+
+    def _wake(self):
+        if self._wakewfd is not None:
+            os.write(self._wakewfd, b'w')
+
+    def _run(self):
+        """Wait for notifications and poll until stopped
+        """
+        import select
+        poller = select.poll()
+        poller.register(self._wakerfd, select.POLLIN)
+        registered = {}
+
+        while True:
+            with self._lock:
+                watches = list(self._watches)
+            for w in watches:
+                if w.fd is not None and w.fd not in registered:
+                    poller.register(w.fd, select.POLLPRI | select.POLLERR)
+                    registered[w.fd] = w
+
+            timeout = None
+            if watches:
+                timeout = max(0.0, min(w.due for w in watches) - monotonic())
+            events = poller.poll(None if timeout is None else timeout * 1000.0)
+
+            for fd, event in events:
+                if fd == self._wakerfd:
+                    os.read(self._wakerfd, 512)
+                    if not self._running:
+                        return
+                else:
+                    self._check(registered[fd])
+
+            now = monotonic()
+            for w in watches:
+                if w.due > now:
+                    continue
+                if w.fd is not None:
+                    self._check(w)
+                elif self._check(w):
+                    w.interval = self._mininterval
+                else:
+                    w.interval = min(w.interval * self._backoff, self._maxinterval)
+                w.due = now + w.interval
+
+    def __enter__(self):
+        """Start watching on a thread of its own
+
+        Raises:
+            RuntimeError: When already watching
+        """
+        if self._thread:
+            raise RuntimeError("Notifier already running")
+
+        self._wakerfd, self._wakewfd = os.pipe()
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """Stop watching and close all watched attributes
+        """
+        self._running = False
+        self._wake()
+        self._thread.join()
+        self._thread = None
+
+        os.close(self._wakerfd)
+        os.close(self._wakewfd)
+        self._wakerfd, self._wakewfd = None, None
+
+        with self._lock:
+            for w in self._watches:
+                w.device.backend.close(w.handle)
+            self._watches = []
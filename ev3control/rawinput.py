@@ -0,0 +1,135 @@
+"""Bulk decoding of input events
+
+`evdev.InputDevice.read()` creates an `InputEvent` object per event. A
+`RawEventReader` instead reads many `struct input_event` records from the
+device in a single system call into a buffer it reuses, and decodes them
+all at once, either into light `RawEvent` tuples or, with NumPy, into a
+structured array.
+"""
+
+import errno
+import io
+import struct
+from collections import namedtuple
+from functools import partial
+
+# struct input_event of linux/input.h: a struct timeval followed by type,
+# code and value, in native size and alignment
+#
+INPUT_EVENT = struct.Struct('llHHi')
+
+
+class RawEvent(namedtuple('RawEvent', 'sec usec type code value')):
+    """Input event decoded by a `RawEventReader`
+
+    Has the attributes of `evdev.InputEvent` that callbacks use.
+    """
+    __slots__ = ()
+
+    def timestamp(self):
+        return self.sec + self.usec * 1e-6
+
+
+# Creates a RawEvent from a tuple without a call to Python code
+#
+_newevent = partial(tuple.__new__, RawEvent)
+
+
+def _decoder(record):
+    """Function that decodes the records in a buffer into tuples
+    """
+    iter_unpack = getattr(record, 'iter_unpack', None)
+    if iter_unpack is not None:
+        return iter_unpack
+
+    # Without iter_unpack, unpack all records with a single struct
+    # and regroup the fields, one struct per number of records
+    #
+    structs = {}
+    size, nfields = record.size, len(record.unpack(b'\x00' * record.size))
+    def decode(buffer):
+        n = len(buffer) // size
+        multiple = structs.get(n)
+        if multiple is None:
+            multiple = structs[n] = struct.Struct(record.format * n)
+        return zip(*[iter(multiple.unpack_from(buffer))] * nfields)
+    return decode
+
+
+def dtype():
+    """NumPy dtype of `struct input_event`
+
+    Returns:
+        numpy.dtype: Structured dtype with fields 'sec', 'usec', 'type', 'code' and 'value'
+    """
+    import numpy as np
+    result = np.dtype([('sec', 'l'), ('usec', 'l'), ('type', 'u2'), ('code', 'u2'), ('value', 'i4')],
+                      align=True)
+    if result.itemsize != INPUT_EVENT.size:
+        raise RuntimeError("Unexpected size of struct input_event")
+    return result
+
+
+class RawEventReader(object):
+    """Reads input events from a file descriptor in bulk
+
+    Args:
+        fd (int): Descriptor of an input device, e.g. `InputDevice.fd`. Is not
+            closed by the reader.
+        maxevents (int): Maximum number of events read at once
+    """
+    def __init__(self, fd, maxevents=64):
+        self._fd      = fd
+        self._file    = io.FileIO(fd, 'rb', closefd=False)
+        self._buffer  = bytearray(INPUT_EVENT.size * maxevents)
+        self._view    = memoryview(self._buffer)
+        self._decode  = _decoder(INPUT_EVENT)
+        self._dtype   = None
+
+    def _readinto(self):
+        """Read available events into the buffer
+
+        Returns:
+            int: Number of bytes read, 0 if no events are available
+        """
+        try:
+            n = self._file.readinto(self._buffer)
+        except (IOError, OSError) as e:
+            if e.errno == errno.EAGAIN:
+                return 0
+            raise
+        if n is None:
+            return 0
+        return n - n % INPUT_EVENT.size
+
+    def read(self):
+        """Read the available events
+
+        Returns:
+            list of RawEvent: The events, empty if none are available
+        """
+        n = self._readinto()
+        return list(map(_newevent, self._decode(self._view[:n])))
+
+    def readtuples(self):
+        """Read the available events as plain tuples
+
+        Returns:
+            list of tpl of (int, int, int, int, int): Seconds, microseconds,
+                type, code and value of each event
+        """
+        n = self._readinto()
+        return list(self._decode(self._view[:n]))
+
+    def readarray(self):
+        """Read the available events into a NumPy array
+
+        Returns:
+            numpy.ndarray: Structured array with dtype `dtype()`. A copy, so it
+                stays valid after the next read.
+        """
+        import numpy as np
+        if self._dtype is None:
+            self._dtype = dtype()
+        n = self._readinto()
+        return np.frombuffer(self._buffer, dtype=self._dtype, count=n // INPUT_EVENT.size).copy()
@@ -0,0 +1,196 @@
+"""Registry of connected devices
+
+For every device class (e.g. /sys/class/tacho-motor) the registry keeps a
+mapping of port name to device folder. The mapping is built in one pass
+over the class folder and rebuilt when the folder changes, so constructing
+a device becomes a dictionary lookup. Each backend (see `sysfs`) holds one
+registry per class, so the registries of the default backend are shared
+by the whole process.
+
+Changes are picked up with inotify when available and by comparing the
+modification time of the class folder otherwise. Since sysfs does not
+reliably report either for devices the kernel adds or removes, a lookup
+that misses, or that hits a folder that has gone away, also rebuilds the
+mapping before giving up.
+"""
+
+import os
+import threading
+
+
+class _MtimeWatch(object):
+    """Detect changes to a folder by polling its modification time
+
+    Args:
+        folder (str): Folder to watch
+    """
+    def __init__(self, folder):
+        self._folder = folder
+        self._stamp  = self._getstamp()
+
+    def _getstamp(self):
+        try:
+            st = os.stat(self._folder)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime, st.st_nlink)
+
+    def changed(self):
+        """Whether the folder changed since the last call
+
+        Returns:
+            bool: True if the folder changed
+        """
+        stamp = self._getstamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def close(self):
+        pass
+
+
+class _InotifyWatch(object):
+    """Detect entries being added to or removed from a folder with inotify
+
+    Args:
+        folder (str): Folder to watch
+
+    Raises:
+        OSError: When inotify is not available or `folder` can not be watched
+    """
+
+    # Flags from <sys/inotify.h>
+    #
+    _IN_MOVED_FROM = 0x00000040
+    _IN_MOVED_TO   = 0x00000080
+    _IN_CREATE     = 0x00000100
+    _IN_DELETE     = 0x00000200
+    _IN_CLOEXEC    = 0o2000000
+    _IN_NONBLOCK   = 0o0004000
+
+    def __init__(self, folder):
+        import ctypes, ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            init = libc.inotify_init1
+            addwatch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError("inotify is not available")
+
+        self._fd = init(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = self._IN_CREATE | self._IN_DELETE | self._IN_MOVED_FROM | self._IN_MOVED_TO
+        if addwatch(self._fd, folder.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            self._fd = None
+            raise OSError(errno, "Can not watch %(f)s"%{'f': folder})
+
+    def changed(self):
+        """Whether any events arrived since the last call
+
+        Returns:
+            bool: True if the folder changed
+        """
+        import errno
+        changed = False
+        while True:
+            try:
+                if not os.read(self._fd, 4096):
+                    break
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            changed = True
+        return changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def watchfolder(folder):
+    """Watch `folder` with inotify, or by its modification time if
+    inotify is not available
+    """
+    try:
+        return _InotifyWatch(folder)
+    except OSError:
+        return _MtimeWatch(folder)
+
+
+class DeviceRegistry(object):
+    """Mapping of port name to device folder for one device class
+
+    Args:
+        backend (sysfs.Backend): Backend that provides the devices
+        classname (str): Name of the device class, e.g. 'tacho-motor'
+    """
+    def __init__(self, backend, classname):
+        self._backend   = backend
+        self._classname = classname
+        self._lock      = threading.Lock()
+        self._watch     = backend.watch(classname)
+
+        # Mapping of port name to device folder, built on first use
+        #
+        self._devices   = None
+
+    def _scan(self):
+        """Read the address of every device of the class
+
+        Returns:
+            dict: Mapping of port name to device folder
+        """
+        devices = {}
+        for folder in self._backend.devices(self._classname):
+            try:
+                address = self._backend.read(folder, 'address')
+            except IOError:
+                # The device disappeared while scanning
+                #
+                continue
+            devices[address] = folder
+        return devices
+
+    def find(self, port):
+        """Look up the folder of the device on `port`
+
+        Args:
+            port (str): Port name as it appears in the 'address' attribute, e.g. 'outA'
+
+        Returns:
+            str or None: Folder of the device, None if no device is connected to `port`
+        """
+        with self._lock:
+            if self._devices is None or self._watch.changed():
+                self._devices = self._scan()
+
+            folder = self._devices.get(port)
+            if folder is None or not self._backend.isdevice(folder):
+                self._devices = self._scan()
+                folder = self._devices.get(port)
+            return folder
+
+    def ports(self):
+        """Ports with a connected device
+
+        Returns:
+            list of str: Port names
+        """
+        with self._lock:
+            if self._devices is None or self._watch.changed():
+                self._devices = self._scan()
+            return sorted(self._devices)
+
+    def close(self):
+        """Stop watching the class folder
+        """
+        self._watch.close()
+
@@ -0,0 +1,191 @@
+"""Sample motor state at a fixed rate
+
+A `MotorSampler` is the single reader of a set of motor attributes. It
+takes a `TachoMotor.snapshot()` at a fixed rate on a thread of its own and
+keeps the samples in a ring buffer. Controllers, monitors and services
+then read the latest sample or a window of samples from memory instead of
+each reading sysfs themselves.
+"""
+
+import threading
+from array import array
+
+from .clock import monotonic
+
+# Snapshot fields that hold a number and can be sampled
+#
+_numericfields = ('position', 'position_sp', 'speed', 'speed_sp', 'duty_cycle', 'duty_cycle_sp')
+
+
+class MotorSampler(object):
+    """Samples attributes of a motor into a ring buffer
+
+    Sampling starts when entering a `with` block and stops when leaving it.
+    Instead, `sample()` can be called directly, e.g. from a scheduler.
+
+    Args:
+        motor (ev3.TachoMotor): Motor to sample. Should be in a `with` block
+            so the attributes are read over pooled handles.
+        fields (sequence of str): Attributes to sample, any of 'position',
+            'position_sp', 'speed', 'speed_sp', 'duty_cycle' and 'duty_cycle_sp'
+        freq (float): Samples per second
+        size (int): Number of samples kept
+
+    Raises:
+        ValueError: When a field can not be sampled
+    """
+    def __init__(self, motor, fields=('position', 'speed', 'duty_cycle'), freq=100.0, size=1024):
+        for field in fields:
+            if field not in _numericfields:
+                raise ValueError("'%(f)s' can not be sampled"%{'f': field})
+        if size < 1:
+            raise ValueError("size should be at least 1")
+
+        self._motor  = motor
+        self._fields = tuple(fields)
+        self._freq   = float(freq)
+        self._size   = size
+
+        # Ring buffers with the timestamps and with the values
+        # of each field
+        #
+        self._times  = array('d', [0.0]) * size
+        self._values = dict((field, array('d', [0.0]) * size) for field in self._fields)
+
+        # Total number of samples taken and the most recent one
+        #
+        self._count  = 0
+        self._latest = None
+
+        self._lock   = threading.Lock()
+
+        # Thread on which sampling takes place and the event
+        # that stops it
+        #
+        self._thread = None
+        self._stop   = None
+
+    def _get_fields(self):
+        return self._fields
+
+    fields = property(_get_fields)
+    """Sampled attributes
+    """
+
+    def _get_count(self):
+        return self._count
+
+    count = property(_get_count)
+    """Total number of samples taken
+    """
+
+    def sample(self):
+        """Take a sample now
+
+        Returns:
+            ev3.MotorSnapshot: The sample
+        """
+        snapshot = self._motor.snapshot(self._fields)
+        with self._lock:
+            i = self._count % self._size
+            self._times[i] = snapshot.timestamp
+            for field in self._fields:
+                self._values[field][i] = getattr(snapshot, field)
+            self._count += 1
+            self._latest = snapshot
+        return snapshot
+
+    def latest(self):
+        """The most recent sample
+
+        Returns:
+            ev3.MotorSnapshot or None: The sample, None if no sample was taken yet
+        """
+        return self._latest
+
+    def value(self, field):
+        """The most recent value of a field
+
+        Raises:
+            RuntimeError: When no sample was taken yet
+        """
+        latest = self._latest
+        if latest is None:
+            raise RuntimeError("No sample taken yet")
+        return getattr(latest, field)
+
+    def getter(self, field):
+        """Create a function that returns the most recent value of a field
+
+        For example `PController(kp, setpoint, sampler.getter('position'), out)`
+
+        Returns:
+            callable: Function returning the value as a float
+        """
+        if field not in self._fields:
+            raise ValueError("'%(f)s' is not sampled"%{'f': field})
+        return lambda: float(self.value(field))
+
+    def window(self, n=None):
+        """The most recent samples, oldest first
+
+        Args:
+            n (int or None): Maximum number of samples, None for all samples kept
+
+        Returns:
+            tpl of (array, dict): Timestamps and a mapping of field to values
+        """
+        with self._lock:
+            available = min(self._count, self._size)
+            if n is None or n > available:
+                n = available
+            end   = self._count % self._size
+            start = (end - n) % self._size
+
+            def extract(buffer):
+                if n == 0:
+                    return array(buffer.typecode)
+                if start < end:
+                    return buffer[start:end]
+                return buffer[start:] + buffer[:end]
+
+            return extract(self._times), dict((field, extract(values)) for field, values in self._values.items())
+
+    def _run(self):
+        """Sample at a fixed rate until stopped
+
+        Deadlines are absolute, so the rate does not drift with the time
+        a sample takes. Missed deadlines are skipped.
+        """
+        period   = 1.0 / self._freq
+        deadline = monotonic()
+        while not self._stop.is_set():
+            self.sample()
+
+            deadline += period
+            now = monotonic()
+            if deadline < now:
+                deadline += ((now - deadline) // period + 1) * period
+            self._stop.wait(deadline - now)
+
+    def __enter__(self):
+        """Start sampling on a thread of its own
+
+        Raises:
+            RuntimeError: When the sampler is already running
+        """
+        if self._thread:
+            raise RuntimeError("Sampler already running")
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """Stop sampling
+        """
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
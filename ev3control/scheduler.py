@@ -0,0 +1,248 @@
+"""Many control loops on a single thread
+
+A `ControlScheduler` runs any number of control loops, each at its own
+rate, on one thread. The loops are kept in a heap ordered by their next
+deadline, and the thread sleeps until the earliest one. Compared to a
+thread per loop this avoids contention for the GIL and context switches,
+which matters on the single core of the EV3.
+
+Loops can depend on sources, e.g. `MotorSampler.sample`. A source is
+called once for all loops that are due at the same time, before any of
+them runs, so loops sharing a motor share a single read of it. Deadlines
+are aligned, so e.g. a 50 Hz loop is due together with every other
+iteration of a 100 Hz loop.
+"""
+
+import heapq
+import threading
+
+from .clock import monotonic
+from .loopstats import LoopStats
+
+
+class _Loop(object):
+    """A control loop hosted by a scheduler
+    """
+    __slots__ = ('name', 'step', 'period', 'sources', 'overrun', 'stats',
+                 'deadline', 'overruns', 'active')
+
+    def __init__(self, name, step, period, sources, overrun):
+        self.name     = name
+        self.step     = step
+        self.period   = period
+        self.sources  = sources
+        self.overrun  = overrun
+        self.stats    = LoopStats(period)
+        self.deadline = None
+        self.overruns = 0
+        self.active   = True
+
+
+class ControlScheduler(object):
+    """Runs control loops at fixed rates on a single thread
+
+    Running starts when entering a `with` block and stops when leaving it.
+    Instead, `runpending()` can be called directly from a loop of its own.
+
+    Each loop gets a `loopstats.LoopStats` with its deadline statistics:
+    the input phase is the time spent in its sources, the compute phase
+    is the time its step takes. Loops are added and removed while running.
+    """
+    def __init__(self):
+        self._loops = {}
+        self._heap  = []
+
+        # Deadlines of all loops are multiples of their period after
+        # this time, so loops with related rates are due together
+        #
+        self._epoch = monotonic()
+
+        # Counter that keeps heap entries with equal deadlines ordered
+        # by insertion
+        #
+        self._sequence = 0
+
+        self._lock  = threading.Lock()
+
+        # Thread on which the loops run, the event that wakes it up
+        # and the flag that keeps it running
+        #
+        self._thread  = None
+        self._wakeup  = threading.Event()
+        self._running = False
+
+    def addloop(self, step, freq=None, name=None, sources=(), overrun='skip'):
+        """Add a control loop
+
+        Args:
+            step (callable or controllers.PIDController): Called with the deadline
+                (`clock.monotonic()`) of each iteration. A controller is
+                stepped through its `step()` method.
+            freq (float or None): Iterations per second. None to take the `freq`
+                of `step`.
+            name (str or None): Name of the loop, None for the name of `step`
+            sources (sequence of callable): Called without arguments before the
+                iteration, once for all loops due at the same time
+            overrun (str): What to do when an iteration misses the next deadline.
+                Either 'skip', to continue at the next deadline in phase,
+                or 'catchup', to run the missed iterations right away.
+
+        Returns:
+            str: Name of the loop
+
+        Raises:
+            ValueError: On a non-positive frequency, an unknown overrun policy
+                or a name that is already in use
+        """
+        if freq is None:
+            freq = step.freq
+        if hasattr(step, 'step'):
+            step = step.step
+        if freq <= 0:
+            raise ValueError("Expected positive frequency")
+        if overrun not in ('skip', 'catchup'):
+            raise ValueError("Unknown overrun policy '%(p)s'"%{'p': overrun})
+        if name is None:
+            name = getattr(step, '__name__', None) or repr(step)
+
+        with self._lock:
+            if name in self._loops:
+                raise ValueError("A loop with name %(n)s already exists"%{'n': name})
+            loop = _Loop(name, step, 1.0/freq, tuple(sources), overrun)
+            elapsed = monotonic() - self._epoch
+            loop.deadline = self._epoch + (elapsed // loop.period + 1) * loop.period
+            self._loops[name] = loop
+            self._push(loop)
+        self._wakeup.set()
+        return name
+
+    def removeloop(self, name):
+        """Stop running a loop
+
+        Raises:
+            KeyError: When there is no loop with name `name`
+        """
+        with self._lock:
+            loop = self._loops.pop(name)
+            loop.active = False
+
+    def _push(self, loop):
+        self._sequence += 1
+        heapq.heappush(self._heap, (loop.deadline, self._sequence, loop))
+
+    def names(self):
+        """Names of the loops
+        """
+        with self._lock:
+            return list(self._loops)
+
+    def stats(self, name):
+        """Deadline statistics of a loop
+
+        Returns:
+            loopstats.LoopStats: The statistics
+        """
+        return self._loops[name].stats
+
+    def loopstats(self):
+        """Names and deadline statistics of all loops
+
+        Returns:
+            list of tpl of (str, loopstats.LoopStats): For example as the
+                `loopstats` of a `monitoring.EV3HTTPServer`
+        """
+        with self._lock:
+            return [ (name, loop.stats) for name, loop in self._loops.items() ]
+
+    def snapshot(self):
+        """Deadline statistics of all loops
+
+        Returns:
+            dict: Mapping of name to `LoopStats.snapshot()`
+        """
+        return dict((name, stats.snapshot()) for name, stats in self.loopstats())
+
+    def runpending(self):
+        """Run the iterations that are due
+
+        Returns:
+            float or None: Deadline of the next iteration, None when there are no loops
+        """
+        now = monotonic()
+
+        # Take all loops that are due
+        #
+        due = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                loop = heapq.heappop(heap)[2]
+                if loop.active:
+                    due.append(loop)
+
+        # Call each source they depend on once
+        #
+        called = set()
+        for loop in due:
+            start = monotonic()
+            for source in loop.sources:
+                if source not in called:
+                    source()
+                    called.add(source)
+            inputdone = monotonic()
+            loop.step(loop.deadline)
+            done = monotonic()
+            loop.stats.record(loop.deadline, start, inputdone, done, done)
+
+            deadline = loop.deadline + loop.period
+            if deadline < done:
+                loop.overruns += 1
+                if loop.overrun == 'skip':
+                    deadline += ((done - deadline) // loop.period + 1) * loop.period
+            loop.deadline = deadline
+
+        with self._lock:
+            for loop in due:
+                if loop.active:
+                    self._push(loop)
+            if self._heap:
+                return self._heap[0][0]
+            return None
+
+    def _run(self):
+        """Run the loops until stopped
+        """
+        wakeup = self._wakeup
+        while self._running:
+            deadline = self.runpending()
+            if deadline is None:
+                wakeup.wait()
+            else:
+                timeout = deadline - monotonic()
+                if timeout > 0:
+                    wakeup.wait(timeout)
+            wakeup.clear()
+
+    def __enter__(self):
+        """Start running the loops on a thread of its own
+
+        Raises:
+            RuntimeError: When already running
+        """
+        if self._thread:
+            raise RuntimeError("Scheduler already running")
+
+        self._running = True
+        self._wakeup.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        """Stop running the loops
+        """
+        self._running = False
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,541 @@
+"""Backends for access to device attributes
+
+The device classes in `ev3` do not access files directly but go through a
+backend. Three backends are provided:
+
+    SysfsBackend:     The real thing, attributes are files under /sys/class
+    DirectoryBackend: A folder laid out like /sys/class, e.g. on a tmpfs
+    MemoryBackend:    Attributes are kept in dictionaries, no system calls at all
+
+The latter two make it possible to run and benchmark the stack without
+an EV3, and to tell the cost of the Python code apart from the cost of
+kernel I/O.
+
+A backend provides per-call access (`read()`, `write()`) which opens the
+attribute on every call, and handle based access (`open()`, `pread()`,
+`pwrite()`, `bufferreader()`, `intreader()`, `close()`) which is used by
+`ev3.AttributePool`.
+"""
+
+import os
+import threading
+
+from .registry import DeviceRegistry, watchfolder
+
+# Positioned reads and writes are not available in the os module of
+# every interpreter (e.g. Python 2). There they are called in libc
+# through ctypes, see `_libcpositioned()`.
+#
+_pread  = getattr(os, 'pread', None)
+_pwrite = getattr(os, 'pwrite', None)
+_preadv = getattr(os, 'preadv', None)
+
+# Largest value a sysfs attribute can hold
+#
+_maxattributesize = 4096
+
+# Size of the buffer integer attributes are read into
+#
+_intbuffersize = 32
+
+
+def _libcpositioned():
+    """Positioned reads and writes at offset 0 through libc
+
+    Unlike a seek followed by a read or write, these do not touch the file
+    position, so threads can share a descriptor.
+
+    Returns:
+        tpl of (callable, callable, callable) or None: `pread(fd)` returning the
+            value as a string, `bufferreader(fd, buffer)` creating a function that
+            reads into a bytearray and returns the number of bytes read, and
+            `pwrite(fd, value)`. None when libc does not provide them.
+    """
+    import ctypes, ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        prototype = ctypes.CFUNCTYPE(ctypes.c_ssize_t, ctypes.c_int, ctypes.c_void_p,
+                                     ctypes.c_size_t, ctypes.c_long, use_errno=True)
+        cpread  = prototype(('pread', libc))
+        cpwrite = prototype(('pwrite', libc))
+    except (OSError, AttributeError):
+        return None
+
+    def fail(call):
+        errno = ctypes.get_errno()
+        raise OSError(errno, "%(c)s failed: %(e)s"%{'c': call, 'e': os.strerror(errno)})
+
+    def bufferreader(fd, buffer):
+        size = len(buffer)
+        cbuffer = (ctypes.c_char * size).from_buffer(buffer)
+        def read():
+            n = cpread(fd, cbuffer, size, 0)
+            if n < 0:
+                fail('pread')
+            return n
+        return read
+
+    # One buffer per thread to read string values into
+    #
+    scratch = threading.local()
+
+    def pread(fd):
+        try:
+            buffer, cbuffer = scratch.buffer, scratch.cbuffer
+        except AttributeError:
+            buffer  = scratch.buffer  = bytearray(_maxattributesize)
+            cbuffer = scratch.cbuffer = (ctypes.c_char * _maxattributesize).from_buffer(buffer)
+        n = cpread(fd, cbuffer, _maxattributesize, 0)
+        if n < 0:
+            fail('pread')
+        return str(buffer[0:n])
+
+    def pwrite(fd, value):
+        if cpwrite(fd, value, len(value), 0) < 0:
+            fail('pwrite')
+
+    return pread, bufferreader, pwrite
+
+
+# Only needed when the os module lacks positioned reads
+#
+_libcpread = _libcbufferreader = _libcpwrite = None
+if not _pread:
+    _libcpread, _libcbufferreader, _libcpwrite = _libcpositioned() or (None, None, None)
+
+
+def _strip(value):
+    """Remove the newline sysfs appends to attribute values
+    """
+    if value[-1:] == '\n':
+        return value[0:-1]
+    return value
+
+
+# int() parses a buffer object on the read buffer, which is cheaper than
+# creating a string of its contents. Python 3 has no buffer objects, but
+# its int() accepts a bytearray, so there a slice is parsed.
+#
+try:
+    _intview = buffer
+except NameError:
+    _intview = lambda data, offset, size: data[offset:offset + size]
+
+
+class Backend(object):
+    """Interface of a backend
+
+    Devices of a class are identified by their folder, as returned by
+    `devices()`. Attribute values are strings without trailing newline.
+    """
+    def __init__(self):
+        self._registries     = {}
+        self._registrieslock = threading.Lock()
+
+    def registry(self, classname):
+        """The registry of devices of a class on this backend
+
+        There is one registry per class and backend, which makes the
+        registries of the default backend process-wide.
+
+        Args:
+            classname (str): Name of a device class, e.g. 'tacho-motor'
+
+        Returns:
+            registry.DeviceRegistry: Registry for `classname`
+        """
+        with self._registrieslock:
+            try:
+                return self._registries[classname]
+            except KeyError:
+                reg = self._registries[classname] = DeviceRegistry(self, classname)
+                return reg
+
+    def devices(self, classname):
+        """Folders of all devices of a class
+
+        Args:
+            classname (str): Name of a device class, e.g. 'tacho-motor'
+
+        Returns:
+            list of str: Device folders
+        """
+        raise NotImplementedError
+
+    def isdevice(self, folder):
+        """Whether `folder` still refers to a device
+        """
+        raise NotImplementedError
+
+    def watch(self, classname):
+        """Create an object whose `changed()` method tells whether devices
+        of a class were added or removed since the last call
+        """
+        raise NotImplementedError
+
+    def read(self, folder, attribute):
+        """Read an attribute without keeping it open
+
+        Returns:
+            str: Value of the attribute
+        """
+        raise NotImplementedError
+
+    def write(self, folder, attribute, value):
+        """Write an attribute without keeping it open
+
+        Args:
+            folder (str): Device folder
+            attribute (str): Name of the attribute
+            value (str): Value to write
+        """
+        raise NotImplementedError
+
+    def open(self, folder, attribute):
+        """Open an attribute
+
+        Returns:
+            object: Handle to pass to `pread()`, `pwrite()` and `close()`
+        """
+        raise NotImplementedError
+
+    def pread(self, handle):
+        """Read an opened attribute from the start
+
+        Returns:
+            str: Value of the attribute
+        """
+        raise NotImplementedError
+
+    def pwrite(self, handle, value):
+        """Write an opened attribute from the start
+        """
+        raise NotImplementedError
+
+    def fileno(self, handle):
+        """File descriptor of an opened attribute
+
+        Returns:
+            int or None: The descriptor, None if the backend does not
+                access attributes through file descriptors
+        """
+        return None
+
+    def bufferreader(self, handle, buffer):
+        """Create a function that reads an opened attribute into `buffer`
+
+        Returns:
+            callable: Function without arguments that reads the raw value
+                into `buffer` and returns the number of bytes read. Valid
+                until `handle` is closed.
+        """
+        raise NotImplementedError
+
+    def intreader(self, handle):
+        """Create a function that reads an opened integer attribute
+
+        The value is read into a buffer allocated once, since integer
+        attributes are read at high rates. Each read still creates a small
+        object to parse, a buffer view or on Python 3 a slice of the value,
+        but not the string of up to 4096 bytes `pread()` returns.
+
+        Returns:
+            callable: Function without arguments returning the value as an int.
+                Valid until `handle` is closed.
+        """
+        data = bytearray(_intbuffersize)
+        read = self.bufferreader(handle, data)
+        return lambda: int(_intview(data, 0, read()))
+
+    def close(self, handle):
+        """Close an opened attribute
+        """
+        raise NotImplementedError
+
+
+class SysfsBackend(Backend):
+    """Attributes are files in sysfs
+
+    Args:
+        root (str): Folder with a sub-folder for each device class
+    """
+    def __init__(self, root='/sys/class'):
+        super(SysfsBackend, self).__init__()
+        self._root = root
+
+    def _classfolder(self, classname):
+        return os.path.join(self._root, classname)
+
+    def devices(self, classname):
+        classfolder = self._classfolder(classname)
+        try:
+            names = os.listdir(classfolder)
+        except OSError:
+            return []
+        return [ os.path.join(classfolder, name) for name in names ]
+
+    def isdevice(self, folder):
+        return os.path.isdir(folder)
+
+    def watch(self, classname):
+        return watchfolder(self._classfolder(classname))
+
+    def read(self, folder, attribute):
+        with open(os.path.join(folder, attribute), 'r') as handle:
+            return _strip(handle.read())
+
+    def write(self, folder, attribute, value):
+        with open(os.path.join(folder, attribute), 'w') as handle:
+            handle.write(value)
+
+    def open(self, folder, attribute):
+        """Open an attribute for reading and writing, or for reading or
+        writing only if the attribute does not permit both
+
+        Returns:
+            int: File descriptor
+        """
+        import errno
+        path = os.path.join(folder, attribute)
+        for flags in (os.O_RDWR, os.O_RDONLY):
+            try:
+                return os.open(path, flags)
+            except OSError as e:
+                if e.errno != errno.EACCES:
+                    raise
+        return os.open(path, os.O_WRONLY)
+
+    def pread(self, fd):
+        if _pread:
+            return _strip(_pread(fd, _maxattributesize, 0))
+        if _libcpread:
+            return _strip(_libcpread(fd))
+        os.lseek(fd, 0, os.SEEK_SET)
+        return _strip(os.read(fd, _maxattributesize))
+
+    def pwrite(self, fd, value):
+        if _pwrite:
+            _pwrite(fd, value, 0)
+        elif _libcpwrite:
+            _libcpwrite(fd, value)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, value)
+
+    def fileno(self, fd):
+        return fd
+
+    def bufferreader(self, fd, buffer):
+        """Create a function that reads an attribute with a positioned
+        read into `buffer`
+        """
+        if _preadv:
+            buffers = [buffer]
+            return lambda: _preadv(fd, buffers, 0)
+        if _libcbufferreader:
+            return _libcbufferreader(fd, buffer)
+
+        import io
+        fileio   = io.FileIO(fd, 'r', closefd=False)
+        seek     = fileio.seek
+        readinto = fileio.readinto
+        def read():
+            seek(0)
+            return readinto(buffer)
+        return read
+
+    def close(self, fd):
+        os.close(fd)
+
+
+class DirectoryBackend(SysfsBackend):
+    """Attributes are regular files in a folder laid out like /sys/class
+
+    Unlike sysfs, a regular file keeps whatever was written last, so writes
+    truncate the file and append a newline to mimic sysfs.
+
+    Args:
+        root (str): Folder with a sub-folder for each device class
+    """
+    def __init__(self, root):
+        super(DirectoryBackend, self).__init__(root)
+
+    def adddevice(self, classname, name, attributes):
+        """Create the folder and attribute files of a device
+
+        Args:
+            classname (str): Name of a device class, e.g. 'tacho-motor'
+            name (str): Name of the device, e.g. 'motor0'
+            attributes (dict): Mapping of attribute name to value
+
+        Returns:
+            str: Device folder
+        """
+        folder = os.path.join(self._classfolder(classname), name)
+        os.makedirs(folder)
+        for attribute, value in attributes.items():
+            self.write(folder, attribute, str(value))
+        return folder
+
+    def removedevice(self, folder):
+        """Remove a device created with `adddevice()`
+        """
+        import shutil
+        shutil.rmtree(folder)
+
+    def write(self, folder, attribute, value):
+        with open(os.path.join(folder, attribute), 'w') as handle:
+            handle.write(value + '\n')
+
+    def pwrite(self, fd, value):
+        value = value + '\n'
+        super(DirectoryBackend, self).pwrite(fd, value)
+        os.ftruncate(fd, len(value))
+
+
+class _GenerationWatch(object):
+    """Detect changes by comparing a generation counter
+
+    Args:
+        generation (callable): Returns the current generation
+    """
+    def __init__(self, generation):
+        self._generation = generation
+        self._last       = generation()
+
+    def changed(self):
+        generation = self._generation()
+        if generation == self._last:
+            return False
+        self._last = generation
+        return True
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(Backend):
+    """Attributes are entries in dictionaries
+
+    No system calls are made at all. A handle is a pair of the attribute
+    dictionary of a device and the name of an attribute.
+    """
+    def __init__(self):
+        super(MemoryBackend, self).__init__()
+
+        # Mapping of device folder to its attributes
+        #
+        self._folders    = {}
+
+        # Incremented each time a device is added or removed
+        #
+        self._generation = 0
+
+    def adddevice(self, classname, name, attributes):
+        """Add a device
+
+        Args:
+            classname (str): Name of a device class, e.g. 'tacho-motor'
+            name (str): Name of the device, e.g. 'motor0'
+            attributes (dict): Mapping of attribute name to value
+
+        Returns:
+            str: Device folder
+        """
+        folder = classname + '/' + name
+        self._folders[folder] = dict((attribute, str(value)) for attribute, value in attributes.items())
+        self._generation += 1
+        return folder
+
+    def removedevice(self, folder):
+        """Remove a device added with `adddevice()`
+        """
+        del self._folders[folder]
+        self._generation += 1
+
+    def attributes(self, folder):
+        """The attribute dictionary of a device
+
+        Changes to the dictionary are visible to readers of the device.
+        """
+        return self._folders[folder]
+
+    def devices(self, classname):
+        prefix = classname + '/'
+        return [ folder for folder in self._folders if folder.startswith(prefix) ]
+
+    def isdevice(self, folder):
+        return folder in self._folders
+
+    def watch(self, classname):
+        return _GenerationWatch(lambda: self._generation)
+
+    def _attributes(self, folder, attribute):
+        try:
+            attributes = self._folders[folder]
+        except KeyError:
+            attributes = {}
+        if attribute not in attributes:
+            import errno
+            raise IOError(errno.ENOENT, "No such attribute", folder + '/' + attribute)
+        return attributes
+
+    def read(self, folder, attribute):
+        return self._attributes(folder, attribute)[attribute]
+
+    def write(self, folder, attribute, value):
+        self._attributes(folder, attribute)[attribute] = value
+
+    def open(self, folder, attribute):
+        return (self._attributes(folder, attribute), attribute)
+
+    def pread(self, handle):
+        return handle[0][handle[1]]
+
+    def pwrite(self, handle, value):
+        handle[0][handle[1]] = value
+
+    def bufferreader(self, handle, buffer):
+        attributes, attribute = handle
+        def read():
+            value = attributes[attribute]
+            n = min(len(value), len(buffer))
+            buffer[0:n] = value[0:n]
+            return n
+        return read
+
+    def intreader(self, handle):
+        attributes, attribute = handle
+        return lambda: int(attributes[attribute])
+
+    def close(self, handle):
+        pass
+
+
+_default     = None
+_defaultlock = threading.Lock()
+
+def default_backend():
+    """The backend used by devices that are not given one explicitly
+
+    Returns:
+        Backend: A `SysfsBackend` unless changed with `set_default_backend()`
+    """
+    global _default
+    with _defaultlock:
+        if _default is None:
+            _default = SysfsBackend()
+        return _default
+
+def set_default_backend(backend):
+    """Change the backend used by devices that are not given one explicitly
+
+    Useful to run code that constructs its own devices, e.g. the controllers,
+    against a `DirectoryBackend` or `MemoryBackend`.
+
+    Args:
+        backend (Backend): The new default backend
+    """
+    global _default
+    with _defaultlock:
+        _default = backend
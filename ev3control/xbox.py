@@ -5,8 +5,16 @@ Evan Goris
 """
 
 import os
+import threading
+from collections import deque
 
-from evdev import InputDevice, list_devices
+from .clock import monotonic
+
+# Event types, as in linux/input.h
+#
+EV_SYN = 0
+EV_KEY = 1
+EV_ABS = 3
 
 
 def printevent(event):
@@ -14,7 +22,290 @@ def printevent(event):
     print event.code, event.type, event.value
     print evdev.ecodes.bytype[event.type][event.code]
         
-class XCEvents(object):
+class OffloadedCallback(object):
+    """Runs a callback on a worker thread of its own
+
+    Events are put in a bounded queue, so a slow callback does not hold
+    up the thread that dispatches events. When the queue is full,
+    `overflow` decides which events are dropped: 'drop-oldest' drops the
+    oldest queued event, 'latest-only' drops all queued events, so the
+    callback gets the latest event next.
+
+    The worker runs between `start()` and `stop()`, which an
+    `EventDispatcher` calls when it starts and stops delivering events.
+
+    Args:
+        callback (callable): Called with each event on the worker thread
+        maxsize (int): Maximum number of queued events
+        overflow (str): Either 'drop-oldest' or 'latest-only'
+
+    Raises:
+        ValueError: On an unknown overflow policy or a non-positive size
+    """
+    def __init__(self, callback, maxsize=16, overflow='drop-oldest'):
+        if overflow not in ('drop-oldest', 'latest-only'):
+            raise ValueError("Unknown overflow policy '%(p)s'"%{'p': overflow})
+        if maxsize < 1:
+            raise ValueError("maxsize should be at least 1")
+
+        self._callback = callback
+        self._maxsize  = maxsize
+        self._overflow = overflow
+
+        # Queued events with the time they were queued
+        #
+        self._queue     = deque()
+        self._condition = threading.Condition()
+
+        # Metrics
+        #
+        self._queued    = 0
+        self._processed = 0
+        self._dropped   = 0
+        self._maxdepth  = 0
+        self._latency   = 0.0
+        self._maxlatency = 0.0
+
+        # Worker thread and the flag that keeps it running
+        #
+        self._thread    = None
+        self._running   = False
+
+    def _get_callback(self):
+        return self._callback
+
+    callback = property(_get_callback)
+    """The offloaded callback
+    """
+
+    def __call__(self, event):
+        """Queue an event for the callback
+
+        Returns:
+            boolean: True
+        """
+        with self._condition:
+            queue = self._queue
+            if len(queue) >= self._maxsize:
+                if self._overflow == 'drop-oldest':
+                    queue.popleft()
+                    self._dropped += 1
+                else:
+                    self._dropped += len(queue)
+                    queue.clear()
+            queue.append((monotonic(), event))
+            self._queued += 1
+            if len(queue) > self._maxdepth:
+                self._maxdepth = len(queue)
+            self._condition.notify()
+        return True
+
+    def _run(self):
+        """Call back with queued events until stopped and the queue is empty
+        """
+        queue, condition = self._queue, self._condition
+        while True:
+            with condition:
+                while not queue and self._running:
+                    condition.wait()
+                if not queue:
+                    return
+                queued, event = queue.popleft()
+
+            latency = monotonic() - queued
+            self._callback(event)
+
+            self._processed += 1
+            self._latency += latency
+            if latency > self._maxlatency:
+                self._maxlatency = latency
+
+    def start(self):
+        """Start the worker thread, if not running
+        """
+        if self._thread:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread after it handled the queued events
+        """
+        if not self._thread:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def metrics(self):
+        """Queue and latency metrics
+
+        Latency is the time from queueing an event until the callback
+        is called with it, in seconds.
+
+        Returns:
+            dict: 'depth', 'max_depth', 'queued', 'processed', 'dropped',
+                'mean_latency' and 'max_latency'
+        """
+        processed = self._processed
+        return {
+            'depth':        len(self._queue),
+            'max_depth':    self._maxdepth,
+            'queued':       self._queued,
+            'processed':    processed,
+            'dropped':      self._dropped,
+            'mean_latency': self._latency / processed if processed else 0.0,
+            'max_latency':  self._maxlatency,
+        }
+
+class EventDispatcher(object):
+    """Delivers input events to callbacks
+
+    Base of sources of input events. Subclasses generate the events in
+    `_eventsequence()` and provide `absinfos()`.
+
+    Args:
+        callbacks (list of callable or None): Called with every event
+    """
+    def __init__(self, callbacks=None):
+
+        # List of callbacks that will be called
+        # when events occur
+        #
+        self._callbacks = callbacks or []
+
+        # Callbacks that are only called for events of a
+        # certain type and code, by (type, code)
+        #
+        self._routes    = {}
+
+        # Callbacks that run on worker threads, and whether
+        # their workers are running
+        #
+        self._offloaded = []
+        self._working   = False
+
+    def _get_offloaded(self):
+        return list(self._offloaded)
+
+    offloaded = property(_get_offloaded)
+    """Offloaded callbacks (OffloadedCallback), see `add_callback()`
+    """
+
+    def add_callback(self, callback, filter=None, offload=False, maxsize=16,
+                     overflow='drop-oldest'):
+        """Register a function to be called with events
+
+        Callbacks with a filter are called before callbacks without one.
+
+        Args:
+            callback (callable): Called with each event
+            filter (tpl of (int, int) or None): Type and code of the events
+                `callback` should be called with, e.g. `(EV_ABS, ABS_X)`.
+                None for all events.
+            offload (bool): Call `callback` on a worker thread of its own, see
+                `OffloadedCallback`
+            maxsize (int): Maximum number of events queued for an offloaded callback
+            overflow (str): Either 'drop-oldest' or 'latest-only', what to drop
+                when the queue of an offloaded callback is full
+
+        Returns:
+            OffloadedCallback or None: The queue of an offloaded callback, which
+                provides its metrics
+        """
+        result = None
+        if offload:
+            callback = result = OffloadedCallback(callback, maxsize, overflow)
+            self._offloaded.append(callback)
+            if self._working:
+                callback.start()
+
+        if filter is None:
+            self._callbacks.append(callback)
+        else:
+            self._routes.setdefault(tuple(filter), []).append(callback)
+        return result
+
+    def _startworkers(self):
+        """Start the workers of the offloaded callbacks
+        """
+        self._working = True
+        for callback in self._offloaded:
+            callback.start()
+
+    def _stopworkers(self):
+        """Stop the workers of the offloaded callbacks, after they handled their queues
+        """
+        self._working = False
+        for callback in self._offloaded:
+            callback.stop()
+
+    def queuemetrics(self):
+        """Metrics of the offloaded callbacks
+
+        Returns:
+            list of dict: `OffloadedCallback.metrics()` of each offloaded callback,
+                with its 'callback' added
+        """
+        result = []
+        for callback in self._offloaded:
+            metrics = callback.metrics()
+            metrics['callback'] = repr(callback.callback)
+            result.append(metrics)
+        return result
+
+    def absinfos(self):
+        """Information on all absolute axes
+
+        Returns:
+            dict: Mapping of axis code to AbsInfo
+        """
+        raise NotImplementedError
+
+    def absinfo(self, type_):
+        """Get information on an absolute input axis
+        
+        Args:
+            type_ (int or str): Code or symbolic name of an absolute axis
+            
+        Returns:
+            AbsInfo: Named tuple with info on `type_`, None if there is no such axis
+        """
+        if type(type_)==str:
+            import evdev.ecodes
+            typecode = evdev.ecodes.ecodes[type_]
+        else:
+            typecode = type_
+        return self.absinfos().get(typecode)
+
+    def _processevents(self):
+        """Process events from the sequence generated by the source
+        
+            The sequence of events is generated by self._eventsequence()
+
+        Returns:
+            int: Number of events processed
+        """
+        routes, callbacks = self._routes, self._callbacks
+        count = 0
+        for event in self._eventsequence():
+            for callback in routes.get((event.type, event.code), ()):
+                callback(event)
+            for callback in callbacks:
+                callback(event)
+            count += 1
+        return count
+
+    def _eventsequence(self):
+        """Generate the sequence of events to dispatch
+        """
+        raise NotImplementedError
+
+class XCEvents(EventDispatcher):
     """Manages a sequence of events from an Xbox controller
 
     Objects of this class poll for events from /dev/input
@@ -26,47 +317,63 @@ class XCEvents(object):
         
     Implementation:
         Resource management: Thread that polls the controller
+
+    With `coalesce` each batch of events read from the controller is
+    reduced to the last event per type and code before dispatch, so a
+    flood of axis events results in a single update per axis. Key events
+    are never dropped.
+
+    With `reader='raw'` events are read by a `rawinput.RawEventReader`,
+    which decodes them in bulk into `rawinput.RawEvent` tuples instead of
+    creating an `evdev.InputEvent` per event.
+
+    Args:
+        callbacks (list of callable or None): Called with every event
+        coalesce (bool): Drop all but the last event per type and code of each batch
+        reader (str): Either 'evdev' or 'raw'
+
+    Raises:
+        ValueError: On an unknown reader
         
     """
-    def __init__(self, callbacks=None):
+    def __init__(self, callbacks=None, coalesce=False, reader='evdev'):
+        super(XCEvents, self).__init__(callbacks)
 
         # The xbox device
         #
         self._xbox      = self._finddevice()
 
-        # List of callbacks that will be called
-        # when xbox events occur
+        # Function that reads the available events
         #
-        self._callbacks = callbacks or []
+        if reader == 'evdev':
+            self._read  = self._xbox.read
+        elif reader == 'raw':
+            from .rawinput import RawEventReader
+            self._read  = RawEventReader(self._xbox.fd).read
+        else:
+            raise ValueError("Unknown reader '%(r)s'"%{'r': reader})
+
+        # Whether to coalesce batches of events and the number of
+        # events dropped doing so
+        #
+        self._coalesce  = coalesce
+        self._dropped   = 0
 
         # The thread that polls the controller
         # Will be initialized in __enter__()
         #
         self._t         = None
 
-    def add_callback(self, callback):
-        self._callbacks.append(callback)
-        
-    def absinfo(self, type_):
-        """Get information on an absolute input axis
-        
-        Args:
-            type_ (int or str): Code or symbolic name of an absolute axis
-            
-        Returns:
-            AbsInfo: Named tuple with info on `type_`
-        """
-        import evdev.ecodes
+    def _get_dropped(self):
+        return self._dropped
+
+    dropped = property(_get_dropped)
+    """Number of events dropped by coalescing
+    """
+
+    def absinfos(self):
         cap = self._xbox.capabilities(absinfo=True, verbose=False)
-        if type(type_)==str:
-            typecode = evdev.ecodes.ecodes[type_]
-        else:
-            typecode = type_
-        abscode = evdev.ecodes.ecodes['EV_ABS']
-        for info in cap[abscode]:
-            if info[0]==typecode:
-                return info[1]
-            
+        return dict(cap.get(EV_ABS, []))
     
     def _finddevice(self):
         """Search for the device that represents the xbox controller
@@ -77,6 +384,7 @@ class XCEvents(object):
         Raises:
             IOError: When no controller can be found
         """
+        from evdev import InputDevice, list_devices
         devices = [ InputDevice(fn) for fn in list_devices()]
         for dev in devices:
             if dev.name.startswith('Xbox Gamepad'):
@@ -97,7 +405,7 @@ class XCEvents(object):
         # Start up a thread that waits for events from
         # the controller.
         #
-        import threading
+        self._startworkers()
         self._t = threading.Thread(target=self._processevents,args=())
         self._t.deamon = True
         self._t.start()
@@ -117,21 +425,13 @@ class XCEvents(object):
         #
         self._t.join()
         self._t = None
+        self._stopworkers()
 
         # Close communication channels
         #
         os.close(self.__signalrfd)
         os.close(self.__signalwfd)    
         
-    def _processevents(self):
-        """Process events from the sequence generated by the controller
-        
-            The sequence of events is generated by self._eventsequence()
-        """
-        for event in self._eventsequence():
-            for callback in self._callbacks:
-                callback(event)
-        
     def _eventsequence(self):
         """Generate a sequence of xbox events
         
@@ -146,6 +446,30 @@ class XCEvents(object):
             r, w, x = select([self._xbox.fd,self.__signalrfd], [],[])
             if self.__signalrfd in r:
                 break
+            elif self._coalesce:
+                for event in self._coalesced(list(self._read())):
+                    yield event
             else:
-                for event in self._xbox.read():
-                    yield event
\ No newline at end of file
+                for event in self._read():
+                    yield event
+
+    def _coalesced(self, events):
+        """Drop all but the last event per type and code, except key events
+
+        Args:
+            events (list of InputEvent): Batch of events
+
+        Returns:
+            list of InputEvent: The remaining events, in order
+        """
+        if len(events) < 2:
+            return events
+
+        last = {}
+        for i, event in enumerate(events):
+            if event.type != EV_KEY:
+                last[(event.type, event.code)] = i
+        kept = [ event for i, event in enumerate(events)
+                 if event.type == EV_KEY or last[(event.type, event.code)] == i ]
+        self._dropped += len(events) - len(kept)
+        return kept
\ No newline at end of file